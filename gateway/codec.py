@@ -0,0 +1,359 @@
+# coding: utf-8
+"""
+the wire format of the tcp messages between the nodes, shared by the gateway
+and the wallet so only the standard library and the optional packages are
+imported here\n
+frame = header("!3I": version, body size, cmd) | body\n
+the cmd is always 0x000065, the low byte of the version is the codec of the
+body and the second byte is the compression:\n
+    0x000001 json text, what the old nodes send and accept(version + cmd == 102)
+    0x000002 msgpack
+    0x000102 msgpack compressed by zlib
+    0x000202 msgpack compressed by zstd\n
+the third byte 0x01 means the body starts with the routing envelope:
+envelope size(!H) | json of MessageType, Sender and Receiver | the message,
+so the relay gateways route the transaction messages and forward the frame
+without decoding the message\n
+the node sends the json frames until the peer tells the codecs it can read:
+the wallet in RegisterKeepAlive, the gateway in NegotiateCodec\n
+dumps/loads are the json functions of the hot paths, backed by orjson or
+ujson when installed, else the standard json
+"""
+import json
+import zlib
+import struct
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FRAME_CMD = 0x000065
+HEADER_SIZE = 12
+HEADER_STRUCT = struct.Struct("!3I")
+
+CODEC_JSON = 0x01
+CODEC_MSGPACK = 0x02
+COMPRESS_NONE = 0x00
+COMPRESS_ZLIB = 0x01
+COMPRESS_ZSTD = 0x02
+
+CODEC_NAMES = {CODEC_JSON: "json", CODEC_MSGPACK: "msgpack"}
+COMPRESS_NAMES = {COMPRESS_ZLIB: "zlib", COMPRESS_ZSTD: "zstd"}
+
+ENVELOPE_FLAG = 0x01
+ENVELOPE_KEYS = ("MessageType", "Sender", "Receiver")
+ENVELOPE_SIZE = struct.Struct("!H")
+
+JSON_VERSION = CODEC_JSON
+
+
+class CodecError(ValueError):
+    pass
+
+
+if orjson is not None:
+    JSON_BACKEND = "orjson"
+
+    def dumps(obj):
+        """
+        :return: the json text of obj, bytes type
+        """
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # the integer out of 64 bits, the subclass of the builtin types...
+            return json.dumps(obj).encode()
+
+    def loads(data):
+        """
+        :param data: bytes or str
+        """
+        return orjson.loads(data)
+
+elif ujson is not None:
+    JSON_BACKEND = "ujson"
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False).encode()
+
+    def loads(data):
+        return ujson.loads(data)
+
+else:
+    JSON_BACKEND = "json"
+
+    def dumps(obj):
+        return json.dumps(obj).encode()
+
+    def loads(data):
+        return json.loads(data)
+
+
+def dumps_text(obj):
+    """
+    :return: the json text of obj, str type
+    """
+    return dumps(obj).decode()
+
+
+class JsonText(object):
+    """
+    the json text made only when the log record is emitted\n
+    usage:\n
+        LOG.info("send message: %s", JsonText(message))
+    """
+    __slots__ = ("obj",)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        try:
+            return dumps_text(self.obj)
+        except (TypeError, ValueError):
+            return str(self.obj)
+
+
+class FrameError(Exception):
+    pass
+
+
+def available_codecs():
+    """
+    :return: list of the codec and compression names this node can read
+    """
+    names = ["json", "zlib", "envelope"]
+    if msgpack is not None:
+        names.append("msgpack")
+    if zstandard is not None:
+        names.append("zstd")
+    return names
+
+
+def negotiate(peer_codecs, local_codecs=None):
+    """
+    :param peer_codecs: list of the names the peer can read\n
+    :return: the frame version(without compression) and the compression to send
+    to the peer
+    """
+    peer_codecs = set(peer_codecs or ())
+    local_codecs = set(local_codecs or available_codecs())
+    codecs = peer_codecs & local_codecs
+    codec = CODEC_MSGPACK if "msgpack" in codecs else CODEC_JSON
+    if "zstd" in codecs:
+        compress = COMPRESS_ZSTD
+    elif "zlib" in codecs:
+        compress = COMPRESS_ZLIB
+    else:
+        compress = COMPRESS_NONE
+    return codec, compress
+
+
+def is_valid_header(version, cmd):
+    return cmd == FRAME_CMD and (version & 0xff) in CODEC_NAMES and \
+        (version >> 8) & 0xff in (COMPRESS_NONE, COMPRESS_ZLIB, COMPRESS_ZSTD) and \
+        (version >> 16) in (0, ENVELOPE_FLAG)
+
+
+def has_envelope(version):
+    return version >> 16 == ENVELOPE_FLAG
+
+
+def can_read(version, names):
+    """
+    :param names: the codec names the peer can read\n
+    :return: whether the peer can read the frame of version
+    """
+    if has_envelope(version) and "envelope" not in names:
+        return False
+    codec_name = CODEC_NAMES.get(version & 0xff)
+    compress = (version >> 8) & 0xff
+    return (codec_name == "json" or codec_name in names) and \
+        (not compress or COMPRESS_NAMES.get(compress) in names)
+
+
+def make_header(version, body_size):
+    return HEADER_STRUCT.pack(version, body_size, FRAME_CMD)
+
+
+def read_envelope(version, body):
+    """
+    :return: dict of the envelope keys, None if the frame has no envelope
+    """
+    if not has_envelope(version):
+        return None
+    try:
+        size, = ENVELOPE_SIZE.unpack_from(body)
+        return loads(body[ENVELOPE_SIZE.size:ENVELOPE_SIZE.size + size])
+    except Exception as ex:
+        raise CodecError("invalid frame envelope: {}".format(ex))
+
+
+def _split_envelope(version, body):
+    """
+    :return: the version and the body of the message without the envelope
+    """
+    if not has_envelope(version):
+        return version, body
+    size, = ENVELOPE_SIZE.unpack_from(body)
+    return version & 0xffff, body[ENVELOPE_SIZE.size + size:]
+
+
+def payload_text(version, body, encoding="utf-8"):
+    """
+    :return: the json text of the message if it is not compressed, else None
+    """
+    version, body = _split_envelope(version, body)
+    if version != JSON_VERSION:
+        return None
+    return body.decode(encoding)
+
+
+def encode_frame(data, codec=CODEC_JSON, compress=COMPRESS_NONE, compress_threshold=None, encoding="utf-8",
+                 envelope=False):
+    """
+    :param data: python obj or str(the json text)\n
+    :param compress: used only by the binary codec when the body is larger than
+    compress_threshold\n
+    :param envelope: add the routing envelope, data must be dict\n
+    :return: bytes type
+    """
+    if codec == CODEC_MSGPACK and msgpack is not None:
+        if isinstance(data, str):
+            data = loads(data)
+        body = msgpack.packb(data, use_bin_type=True)
+        version = CODEC_MSGPACK
+        if compress and compress_threshold is not None and len(body) > compress_threshold:
+            if compress == COMPRESS_ZSTD and zstandard is not None:
+                body = zstandard.ZstdCompressor().compress(body)
+                version |= COMPRESS_ZSTD << 8
+            else:
+                body = zlib.compress(body)
+                version |= COMPRESS_ZLIB << 8
+    else:
+        if not isinstance(data, str):
+            body = dumps(data)
+        else:
+            body = data.encode(encoding)
+        version = JSON_VERSION
+    if envelope and isinstance(data, dict):
+        routing = dumps({key: data.get(key) for key in ENVELOPE_KEYS})
+        body = ENVELOPE_SIZE.pack(len(routing)) + routing + body
+        version |= ENVELOPE_FLAG << 16
+    return HEADER_STRUCT.pack(version, len(body), FRAME_CMD) + body
+
+
+def decode_body(version, body, encoding="utf-8"):
+    """
+    :return: python obj, raise CodecError if the body can't be decoded
+    """
+    try:
+        version, body = _split_envelope(version, body)
+        compress = version >> 8
+        if compress == COMPRESS_ZLIB:
+            body = zlib.decompress(body)
+        elif compress == COMPRESS_ZSTD:
+            if zstandard is None:
+                raise CodecError("zstandard is not installed")
+            body = zstandard.ZstdDecompressor().decompress(body)
+        if version & 0xff == CODEC_MSGPACK:
+            if msgpack is None:
+                raise CodecError("msgpack is not installed")
+            return msgpack.unpackb(body, raw=False)
+        return loads(body if encoding == "utf-8" else body.decode(encoding))
+    except CodecError:
+        raise
+    except Exception as ex:
+        raise CodecError("invalid frame body: {}".format(ex))
+
+
+class FrameDecoder():
+    """
+    split the frames from the received bytes\n
+    the bytes are appended to one bytearray and read by offset, the consumed
+    part is dropped only when it is more than half of the buffer, so the
+    chunked large frame is not copied again and again
+    """
+    # the cmd field of the valid header, used to search the next frame
+    cmd_mark = struct.pack("!I", FRAME_CMD)
+
+    def __init__(self, max_frame_size):
+        self.buffer = bytearray()
+        self.offset = 0
+        self.max_frame_size = max_frame_size
+
+    def feed(self, data):
+        self.buffer += data
+
+    def _compact(self):
+        if self.offset and self.offset * 2 >= len(self.buffer):
+            del self.buffer[:self.offset]
+            self.offset = 0
+
+    def check_header(self, offset):
+        """
+        :return: (version, body size), raise FrameError if the header is invalid
+        """
+        version, body_size, cmd = HEADER_STRUCT.unpack_from(self.buffer, offset)
+        if not is_valid_header(version, cmd):
+            raise FrameError("invalid frame header {}".format((version, body_size, cmd)))
+        if body_size > self.max_frame_size:
+            raise FrameError("frame size {} exceeds {}".format(body_size, self.max_frame_size))
+        return version, body_size
+
+    def frames(self):
+        """
+        :return: generator of (version, body) of the complete frames, the body is
+        bytes type; raise FrameError on the invalid header, then resync() or drop
+        the decoder
+        """
+        try:
+            while len(self.buffer) - self.offset >= HEADER_SIZE:
+                version, body_size = self.check_header(self.offset)
+                start = self.offset + HEADER_SIZE
+                if len(self.buffer) < start + body_size:
+                    return
+                with memoryview(self.buffer) as view:
+                    body = bytes(view[start:start + body_size])
+                self.offset = start + body_size
+                yield version, body
+        finally:
+            self._compact()
+
+    def resync(self):
+        """
+        skip to the next position looks like a valid header
+        :return: number of the bytes skipped
+        """
+        start = self.offset
+        position = self.buffer.find(self.cmd_mark, self.offset + 1 + 8)
+        while position != -1:
+            try:
+                self.check_header(position - 8)
+            except FrameError:
+                position = self.buffer.find(self.cmd_mark, position + 1)
+            else:
+                self.offset = position - 8
+                break
+        else:
+            # keep the tail which maybe the part of next header
+            self.offset = max(self.offset, len(self.buffer) - HEADER_SIZE + 1)
+        skipped = self.offset - start
+        self._compact()
+        return skipped
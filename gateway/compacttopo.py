@@ -0,0 +1,427 @@
+# coding: utf-8
+"""
+the compact graph backend for Nettopo\n
+public keys are interned to integer ids, the adjacency is stored as CSR arrays
+with the parallel fee/status/balance arrays, and the route search is the
+bidirectional dijkstra over these arrays\n
+select it by cg_topo_backend = "compact"
+"""
+import heapq
+import json
+from array import array
+import numpy as np
+import networkx as nx
+from topo import Nettopo
+from noderegistry import TopoNode
+import utils
+
+
+class CompactGraph(object):
+    """
+    the graph only implement the part of networkx.Graph api that Nettopo used\n
+    nodes: {public_key: node attributes}\n
+    edges: (u_id, v_id, channel name) stored in the arrays indexed by edge id,
+    with the balance of both endpoints, the weight of edge always is fee[u] + fee[v]\n
+    the csr adjacency is rebuilt only when the edges changed since last build
+    exceed the threshold, the edges added after the build are kept in extra
+    and the removed ones in removed until then
+    """
+    # min number of the pending edges to rebuild the csr, and the ratio to all edges
+    rebuild_count = 64
+    rebuild_ratio = 0.05
+    # the network magic the nodes' shared attributes belong to
+    magic = None
+
+    def __init__(self):
+        self.ids = {}
+        self.keys = []
+        self.nodes = {}
+        self.fee = array("d")
+        self.status = array("b")
+        self.edge_ids = {}
+        self.edge_u = array("i")
+        self.edge_v = array("i")
+        self.edge_name = []
+        # the balance of edge_u and edge_v in the channel, nan means unknown
+        self.balance_u = array("d")
+        self.balance_v = array("d")
+        # csr arrays
+        self.indptr = array("q", [0])
+        self.indices = array("i")
+        self.csr_edge = array("i")
+        # {node id: [edge id]} the edges added after the csr built
+        self.extra = {}
+        # the edge ids removed after the csr built
+        self.removed = set()
+
+    @staticmethod
+    def _edge_key(u, v):
+        if u > v:
+            u, v = v, u
+        return (u << 32) | v
+
+    def _intern(self, pk):
+        nid = self.ids.get(pk)
+        if nid is None:
+            nid = len(self.keys)
+            self.ids[pk] = nid
+            self.keys.append(pk)
+            self.nodes[pk] = TopoNode(pk, self.magic)
+            self.fee.append(0)
+            self.status.append(0)
+        return nid
+
+    def _balance(self, pk, name):
+        balance = utils.parse_amount((self.nodes[pk].get("Balance") or {}).get(name))
+        return float("nan") if balance is None else balance
+
+    def _edge_ids_of(self, nid):
+        """
+        :return: list of the alive edge ids of the node
+        """
+        eids = []
+        if nid < len(self.indptr) - 1:
+            eids.extend(self.csr_edge[self.indptr[nid]:self.indptr[nid + 1]])
+        eids.extend(self.extra.get(nid, ()))
+        if self.removed:
+            eids = [eid for eid in eids if eid not in self.removed]
+        return eids
+
+    def _refresh_edge(self, eid):
+        name = self.edge_name[eid]
+        self.balance_u[eid] = self._balance(self.keys[self.edge_u[eid]], name)
+        self.balance_v[eid] = self._balance(self.keys[self.edge_v[eid]], name)
+
+    def refresh_node(self, pk):
+        """
+        refresh the fee/status/balance arrays after the node attributes changed
+        """
+        nid = self.ids[pk]
+        node = self.nodes[pk]
+        self.fee[nid] = utils.parse_amount(node.get("Fee")) or 0
+        self.status[nid] = 1 if node.get("Status") else 0
+        for eid in self._edge_ids_of(nid):
+            self._refresh_edge(eid)
+
+    def add_node(self, pk, **attr):
+        self._intern(pk)
+        self.nodes[pk].update(attr)
+        self.refresh_node(pk)
+
+    def has_node(self, pk):
+        return pk in self.ids
+
+    def add_edge(self, u, v, **attr):
+        uid = self._intern(u)
+        vid = self._intern(v)
+        key = self._edge_key(uid, vid)
+        eid = self.edge_ids.get(key)
+        if eid is not None:
+            self.edge_name[eid] = attr.get("name")
+        else:
+            eid = len(self.edge_name)
+            self.edge_u.append(uid)
+            self.edge_v.append(vid)
+            self.edge_name.append(attr.get("name"))
+            self.balance_u.append(0)
+            self.balance_v.append(0)
+            self.edge_ids[key] = eid
+            self.extra.setdefault(uid, []).append(eid)
+            self.extra.setdefault(vid, []).append(eid)
+        self._refresh_edge(eid)
+
+    def has_edge(self, u, v):
+        uid = self.ids.get(u)
+        vid = self.ids.get(v)
+        if uid is None or vid is None:
+            return False
+        return self._edge_key(uid, vid) in self.edge_ids
+
+    def remove_edge(self, u, v):
+        eid = self.edge_ids.pop(self._edge_key(self.ids[u], self.ids[v]))
+        self.removed.add(eid)
+
+    def number_of_edges(self):
+        return len(self.edge_ids)
+
+    def _pending(self):
+        return len(self.edge_name) - len(self.csr_edge) // 2 + len(self.removed)
+
+    def _build(self):
+        """
+        drop the removed edges, renumber the edges and rebuild the csr arrays
+        """
+        alive = sorted(self.edge_ids.values())
+        if self.removed:
+            self.edge_u = array("i", [self.edge_u[eid] for eid in alive])
+            self.edge_v = array("i", [self.edge_v[eid] for eid in alive])
+            self.balance_u = array("d", [self.balance_u[eid] for eid in alive])
+            self.balance_v = array("d", [self.balance_v[eid] for eid in alive])
+            self.edge_name = [self.edge_name[eid] for eid in alive]
+            renumber = {eid: i for i, eid in enumerate(alive)}
+            self.edge_ids = {key: renumber[eid] for key, eid in self.edge_ids.items()}
+        n = len(self.keys)
+        m = len(self.edge_name)
+        u = np.frombuffer(self.edge_u, dtype=np.int32, count=m) if m else np.zeros(0, dtype=np.int32)
+        v = np.frombuffer(self.edge_v, dtype=np.int32, count=m) if m else np.zeros(0, dtype=np.int32)
+        rows = np.concatenate([u, v])
+        order = np.argsort(rows, kind="stable")
+        self.indices = array("i", np.concatenate([v, u])[order].astype(np.int32).tobytes())
+        self.csr_edge = array("i", np.concatenate([np.arange(m), np.arange(m)])[order].astype(np.int32).tobytes())
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        self.indptr = array("q", indptr.tobytes())
+        self.extra = {}
+        self.removed = set()
+
+    def _maybe_build(self):
+        pending = self._pending()
+        if pending and pending >= max(self.rebuild_count, self.rebuild_ratio * len(self.edge_ids)):
+            self._build()
+
+    def neighbors(self, pk):
+        nid = self.ids[pk]
+        edge_u = self.edge_u
+        edge_v = self.edge_v
+        return iter([
+            self.keys[edge_v[eid] if edge_u[eid] == nid else edge_u[eid]]
+            for eid in self._edge_ids_of(nid)
+        ])
+
+    def edges(self):
+        """
+        :return: list of (u, v, data) like networkx.Graph.edges(data=True)
+        """
+        edges = []
+        for eid in sorted(self.edge_ids.values()):
+            u = self.edge_u[eid]
+            v = self.edge_v[eid]
+            edges.append((self.keys[u], self.keys[v], {
+                "weight": self.fee[u] + self.fee[v],
+                "name": self.edge_name[eid]
+            }))
+        return edges
+
+    def to_networkx(self):
+        """
+        :return: networkx.Graph of the nodes and edges, the node attributes are copied
+        """
+        graph = nx.Graph()
+        graph.add_nodes_from((pk, dict(node)) for pk, node in self.nodes.items())
+        graph.add_edges_from(self.edges())
+        return graph
+
+    def _usable_neighbors(self, u, amount, ignore_ids, ignore_pairs, forward=True):
+        """
+        the edge is skipped when one of its nodes is off-line or the payer's
+        balance of the channel can not carry the amount\n
+        :param forward: u pays the neighbors if True, otherwise the neighbors pay u\n
+        :return: list of (neighbor id, weight)
+        """
+        status = self.status
+        if not status[u] or u in ignore_ids:
+            return []
+        fee = self.fee
+        edge_u = self.edge_u
+        edge_v = self.edge_v
+        balance_u = self.balance_u
+        balance_v = self.balance_v
+        removed = self.removed
+        fee_u = fee[u]
+        usable = []
+        if removed or u in self.extra or u >= len(self.indptr) - 1:
+            eids = self._edge_ids_of(u)
+        else:
+            eids = self.csr_edge[self.indptr[u]:self.indptr[u + 1]]
+        for eid in eids:
+            v = edge_v[eid] if edge_u[eid] == u else edge_u[eid]
+            if not status[v] or v in ignore_ids:
+                continue
+            if ignore_pairs and (u, v) in ignore_pairs:
+                continue
+            if amount:
+                payer = u if forward else v
+                # nan(unknown balance) is never less than amount
+                if (balance_u[eid] if edge_u[eid] == payer else balance_v[eid]) < amount:
+                    continue
+            usable.append((v, fee_u + fee[v]))
+        return usable
+
+    def _search_args(self, ignore_nodes, ignore_edges):
+        ids = self.ids
+        ignore_ids = set(ids[pk] for pk in ignore_nodes or () if pk in ids)
+        ignore_pairs = set()
+        for u, v in ignore_edges or ():
+            if u in ids and v in ids:
+                ignore_pairs.add((ids[u], ids[v]))
+                ignore_pairs.add((ids[v], ids[u]))
+        return ignore_ids, ignore_pairs
+
+    def shortest_path(self, source, target, amount=None, ignore_nodes=None, ignore_edges=None):
+        """
+        bidirectional dijkstra over the arrays\n
+        :return: list of public keys, empty list if no path
+        """
+        if source not in self.ids or target not in self.ids:
+            return []
+        if source == target:
+            return [source]
+        self._maybe_build()
+        ignore_ids, ignore_pairs = self._search_args(ignore_nodes, ignore_edges)
+        sid = self.ids[source]
+        tid = self.ids[target]
+        inf = float("inf")
+        dists = ({sid: 0.0}, {tid: 0.0})
+        preds = ({}, {})
+        visited = (set(), set())
+        heaps = ([(0.0, sid)], [(0.0, tid)])
+        best = inf
+        meet = None
+        while heaps[0] and heaps[1]:
+            # no shorter path can be found through the unvisited nodes
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            # expand the smaller frontier
+            side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+            dist = dists[side]
+            other_dist = dists[1 - side]
+            d, u = heapq.heappop(heaps[side])
+            if u in visited[side]:
+                continue
+            visited[side].add(u)
+            for v, w in self._usable_neighbors(u, amount, ignore_ids, ignore_pairs, side == 0):
+                nd = d + w
+                if nd < dist.get(v, inf):
+                    dist[v] = nd
+                    preds[side][v] = u
+                    heapq.heappush(heaps[side], (nd, v))
+                if v in other_dist and dist[v] + other_dist[v] < best:
+                    best = dist[v] + other_dist[v]
+                    meet = v
+        if meet is None:
+            return []
+        path = [meet]
+        while path[-1] in preds[0]:
+            path.append(preds[0][path[-1]])
+        path.reverse()
+        while path[-1] in preds[1]:
+            path.append(preds[1][path[-1]])
+        return [self.keys[nid] for nid in path]
+
+    def multi_source_shortest_path(self, sources, targets, amount=None, ignore_nodes=None, ignore_edges=None):
+        """
+        dijkstra over the arrays from all the sources, stop at the first target reached\n
+        :return: list of public keys, empty list if no path
+        """
+        ids = self.ids
+        sids = set(ids[pk] for pk in sources if pk in ids)
+        tids = set(ids[pk] for pk in targets if pk in ids)
+        if not sids or not tids:
+            return []
+        self._maybe_build()
+        ignore_ids, ignore_pairs = self._search_args(ignore_nodes, ignore_edges)
+        dist = dict((sid, 0.0) for sid in sids)
+        prev = {}
+        visited = set()
+        heap = [(0.0, sid) for sid in sids]
+        heapq.heapify(heap)
+        tid = None
+        while heap:
+            d, u = heapq.heappop(heap)
+            if u in visited:
+                continue
+            if u in tids:
+                tid = u
+                break
+            visited.add(u)
+            for v, w in self._usable_neighbors(u, amount, ignore_ids, ignore_pairs):
+                if v in visited:
+                    continue
+                nd = d + w
+                if nd < dist.get(v, float("inf")):
+                    dist[v] = nd
+                    prev[v] = u
+                    heapq.heappush(heap, (nd, v))
+        if tid is None:
+            return []
+        path = [tid]
+        while path[-1] in prev:
+            path.append(prev[path[-1]])
+        return [self.keys[nid] for nid in reversed(path)]
+
+
+class CompactNettopo(Nettopo):
+    """
+    Nettopo with the CompactGraph as the graph backend
+    """
+    def __init__(self):
+        super().__init__()
+        self._graph = CompactGraph()
+
+    def __str__(self):
+        return "CompactNettopo(nodes: {}, links: {})".format(
+            list(self._graph.nodes.keys()),
+            [(u, v) for u, v, _ in self._graph.edges()]
+        )
+
+    def _update_node_data(self, node, data):
+        super()._update_node_data(node, data)
+        self._graph.refresh_node(node["Publickey"])
+
+    def _update_shared_data(self, pk, data):
+        self._graph.refresh_node(pk)
+        super()._update_shared_data(pk, data)
+
+    def _update_edge_data(self, nid, diff_fee):
+        # the weight is computed from the fee array at search time
+        pass
+
+    def _shortest_path(self, sid, tid, amount=None, ignore_nodes=None, ignore_edges=None):
+        return self._graph.shortest_path(sid, tid, amount, ignore_nodes, ignore_edges)
+
+    def _multi_source_shortest_path(self, sids, tids, amount=None):
+        return self._graph.multi_source_shortest_path(sids, tids, amount)
+
+    def to_json(self, target=None):
+        """
+        :return type dict or json str, same format as networkx node_link_data
+        """
+        nodes = []
+        for pk, node in self._graph.nodes.items():
+            node_data = dict(node)
+            node_data["id"] = pk
+            nodes.append(node_data)
+        links = []
+        for u, v, edge in self._graph.edges():
+            edge["source"] = u
+            edge["target"] = v
+            links.append(edge)
+        data = {
+            "directed": False,
+            "multigraph": False,
+            "graph": {},
+            "nodes": nodes,
+            "links": links
+        }
+        if target == "str":
+            return json.dumps(data)
+        else:
+            return data
+
+    def to_graph(self, data):
+        """
+        :param data: type dict
+        """
+        graph = CompactGraph()
+        for node in data.get("nodes", []):
+            node = dict(node)
+            graph.add_node(node.pop("id"), **node)
+        for link in data.get("links", data.get("edges", [])):
+            graph.add_edge(link["source"], link["target"], name=link.get("name"))
+        return graph
+
+    def _networkx_graph(self):
+        return self._graph.to_networkx()
+
+    def show_edgelist(self):
+        return self._graph.edges()
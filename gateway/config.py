@@ -18,12 +18,65 @@ cg_tcp_addr = ("0.0.0.0", 8089)
 cg_wsocket_addr = ("0.0.0.0", 8766)
 cg_local_jsonrpc_addr = ("0.0.0.0", 8077)
 cg_remote_jsonrpc_addr = ("0.0.0.0", 20556)
+# the pooled http connections to the wallet jsonrpc servers
+cg_jsonrpc_pool_size = 100
+cg_jsonrpc_pool_size_per_host = 10
+cg_jsonrpc_keepalive = 60
+cg_jsonrpc_timeout = 30
 cg_public_ip_port = "localhost:8089"
 # cg_public_ip_port = "p1"
 cg_node_name = "trinity1"
 cg_max_wallet_cli = 10
+# max bytes of one tcp frame body, and what to do on the invalid frame header: close|resync
+cg_max_frame_size = 64 * 1024 * 1024
+cg_bad_frame_policy = "close"
+# the codecs advertised to the peers(json|msgpack|zlib|zstd|envelope, the uninstalled ones are ignored),
+# the binary frame bodies larger than the threshold are compressed
+cg_wire_codecs = ["json", "msgpack", "zlib", "zstd", "envelope"]
+cg_codec_compress_threshold = 16 * 1024
+# bytes queued to a peer connection above which the node data sync messages are dropped
+# and the peers sending to it are not read until it drains, no more frames are queued
+# above 4 times of it(except the first frame of the empty queue), then keep the connection
+# and refuse the new frames or close it: keep|close
+cg_tcp_send_high_water = 4 * 1024 * 1024
+cg_tcp_slow_peer_policy = "keep"
+# dial the peer at most cg_tcp_dial_retries times, the delay between the dials
+# grows from cg_tcp_backoff_base to cg_tcp_backoff_max seconds with random jitter
+cg_tcp_dial_retries = 5
+cg_tcp_backoff_base = 0.5
+cg_tcp_backoff_max = 30
+# messages queued to one spv websocket, what to do when it is full: drop_oldest|disconnect
+cg_ws_send_queue_size = 256
+cg_ws_slow_client_policy = "drop_oldest"
 ###### Gateway ######
 
+###### Router ######
+# graph backend of Nettopo: networkx|compact(need numpy)
+cg_topo_backend = "networkx"
+# max entries and seconds to live of the route cache
+cg_route_cache_size = 1024
+cg_route_cache_ttl = 30
+# max operations kept in the graph mutation log for delta sync
+cg_sync_log_size = 4096
+# seconds to merge the update_node_data messages before broadcast, 0 to disable
+cg_sync_coalesce_window = 0.5
+# max number of the broadcast message ids remembered for deduplication
+cg_seen_message_size = 8192
+# max number of the alternative routers for one GetRouterInfo
+cg_max_router_count = 5
+# seconds to cache the target wallets searched from remote gateway, and the request timeout
+cg_search_wallet_ttl = 10
+cg_search_wallet_timeout = 5
+# route search mode: dijkstra|alt(A* with landmarks, only for the networkx backend)
+cg_route_mode = "dijkstra"
+# number of the landmarks, and seconds to wait before refresh the stale distance tables
+cg_landmark_count = 8
+cg_landmark_refresh_delay = 1
+# the topologies snapshot file loaded on start, and the seconds between saves(0 only save on shutdown)
+cg_snapshot_path = "gateway.snapshot"
+cg_snapshot_interval = 300
+###### Router ######
+
 # only for debug control
 cg_debug = True
 cg_debug_multi_ports = False
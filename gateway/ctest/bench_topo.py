@@ -0,0 +1,249 @@
+# coding: utf-8
+"""
+routing micro-benchmark of Nettopo over the synthetic channel graphs\n
+the scale-free(barabasi albert) and small-world(newman watts strogatz) graphs
+are built with per-channel balances, then a mix of add_edge, update_data,
+remove_edge and route queries is replayed, the p50/p99 latency and the peak
+memory of every operation are written to a json file\n
+usage(in the gateway directory):\n
+    python ctest/bench_topo.py --sizes 1000,10000 --backends networkx,compact --output bench.json
+"""
+import os
+import sys
+import gc
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+import contextlib
+sys.path.append(os.getcwd())
+import networkx as nx
+import topo
+from topo import Nettopo
+from ctest.test_topo import make_node_data
+
+MODELS = {
+    "scale-free": lambda n, seed: nx.barabasi_albert_graph(n, 2, seed=seed),
+    "small-world": lambda n, seed: nx.newman_watts_strogatz_graph(n, 4, 0.1, seed=seed)
+}
+
+# the weight of every operation in the replayed mix
+OPERATION_MIX = [
+    ("route", 45),
+    ("update_data", 40),
+    ("add_edge", 10),
+    ("remove_edge", 5)
+]
+
+
+def channel_name(u, v):
+    return "{}-{}".format(u, v)
+
+
+def build_topo(backend, graph, rand, network_trait="TNC-bench"):
+    """
+    :return: (Nettopo, list of the public keys, list of the edges)
+    """
+    topo.cg_topo_backend = backend
+    net_topo = Nettopo.create()
+    net_topo.network_trait = network_trait
+    pks = ["pk{}".format(n) for n in graph.nodes]
+    nodes = {}
+    for i, pk in enumerate(pks):
+        nodes[pk] = make_node_data(
+            pk, i,
+            fee=rand.randint(1, 10),
+            Ip="10.0.{}.{}:8089".format(rand.randint(0, 255), rand.randint(0, 255)),
+            Status=0 if rand.random() < 0.05 else 1
+        )
+    edges = []
+    for u, v in graph.edges:
+        u, v = "pk{}".format(u), "pk{}".format(v)
+        name = channel_name(u, v)
+        nodes[u]["Balance"][name] = rand.randint(1, 100)
+        nodes[v]["Balance"][name] = rand.randint(1, 100)
+        edges.append((u, v))
+    for pk in pks:
+        net_topo.add_node(nodes[pk])
+    for u, v in edges:
+        net_topo.add_edge(u, v)
+    return net_topo, pks, edges
+
+
+class Workload(object):
+    """
+    the random operations over one topology
+    """
+    def __init__(self, net_topo, pks, edges, rand):
+        self.net_topo = net_topo
+        self.pks = pks
+        self.edges = edges
+        self.edge_index = {edge: i for i, edge in enumerate(edges)}
+        self.rand = rand
+
+    def route(self):
+        source, target = self.rand.sample(self.pks, 2)
+        amount = self.rand.randint(1, 50)
+        # skip the timethis print of the decorated method
+        Nettopo.find_shortest_path_decide_by_fee.__wrapped__(self.net_topo, source, target, amount)
+
+    def update_data(self):
+        pk = self.rand.choice(self.pks)
+        data = {"Publickey": pk}
+        dice = self.rand.random()
+        if dice < 0.05:
+            data["Status"] = 0 if self.net_topo.get_node_dict(pk)["Status"] else 1
+        elif dice < 0.15:
+            data["Fee"] = self.rand.randint(1, 10)
+        else:
+            balance = self.net_topo.get_node_dict(pk)["Balance"]
+            if balance:
+                data["Balance"] = {self.rand.choice(list(balance.keys())): self.rand.randint(0, 100)}
+        self.net_topo.update_data(data)
+
+    def add_edge(self):
+        u, v = self.rand.sample(self.pks, 2)
+        if self.net_topo.has_edge(u, v):
+            return
+        name = channel_name(u, v)
+        self.net_topo.update_data({"Publickey": u, "Balance": {name: self.rand.randint(1, 100)}})
+        self.net_topo.update_data({"Publickey": v, "Balance": {name: self.rand.randint(1, 100)}})
+        self.net_topo.add_edge(u, v)
+        self.edge_index[(u, v)] = len(self.edges)
+        self.edges.append((u, v))
+
+    def remove_edge(self):
+        if not self.edges:
+            return
+        i = self.rand.randrange(len(self.edges))
+        u, v = self.edges[i]
+        self.net_topo.remove_edge(u, v)
+        # swap remove
+        last = self.edges.pop()
+        del self.edge_index[(u, v)]
+        if i < len(self.edges):
+            self.edges[i] = last
+            self.edge_index[last] = i
+
+    def next_operation(self):
+        total = sum(weight for _, weight in OPERATION_MIX)
+        dice = self.rand.uniform(0, total)
+        for name, weight in OPERATION_MIX:
+            dice -= weight
+            if dice <= 0:
+                return name
+        return OPERATION_MIX[-1][0]
+
+
+def percentile(values, percent):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def run_workload(workload, count, memory_count):
+    """
+    time every operation, the peak memory is sampled with tracemalloc on
+    another memory_count operations for the tracing slows down them
+    """
+    latencies = {name: [] for name, _ in OPERATION_MIX}
+    peaks = {name: 0 for name, _ in OPERATION_MIX}
+    for _ in range(count):
+        name = workload.next_operation()
+        start = time.perf_counter()
+        getattr(workload, name)()
+        latencies[name].append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    for _ in range(memory_count):
+        name = workload.next_operation()
+        tracemalloc.clear_traces()
+        base = tracemalloc.get_traced_memory()[0]
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        getattr(workload, name)()
+        peaks[name] = max(peaks[name], tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    result = {}
+    for name, values in latencies.items():
+        result[name] = {
+            "count": len(values),
+            "mean_ms": sum(values) / len(values) if values else None,
+            "p50_ms": percentile(values, 50),
+            "p99_ms": percentile(values, 99),
+            "peak_bytes": peaks[name]
+        }
+    return result
+
+
+def run_case(model, size, backend, args):
+    rand = random.Random(args.seed)
+    graph = MODELS[model](size, args.seed)
+    # the cases replay the same versions, don't hit the routes of the last case
+    topo.route_cache.clear()
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    net_topo, pks, edges = build_topo(backend, graph, rand, "TNC-{}-{}-{}".format(model, size, backend))
+    build_seconds = time.perf_counter() - start
+    build_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del graph
+    workload = Workload(net_topo, pks, edges, rand)
+    operations = run_workload(workload, args.ops, args.memory_ops)
+    return {
+        "model": model,
+        "nodes": size,
+        "edges": net_topo.get_number_of_edges(),
+        "backend": backend,
+        "route_mode": topo.cg_route_mode,
+        "build_seconds": build_seconds,
+        "build_peak_bytes": build_peak,
+        "operations": operations
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nettopo routing benchmark")
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--models", default=",".join(MODELS.keys()))
+    parser.add_argument("--backends", default="networkx")
+    parser.add_argument("--route-mode", default=topo.cg_route_mode, choices=["dijkstra", "alt"])
+    parser.add_argument("--ops", type=int, default=2000, help="number of the timed operations per case")
+    parser.add_argument("--memory-ops", type=int, default=200, help="number of the memory sampled operations per case")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_topo.json")
+    args = parser.parse_args()
+    topo.cg_route_mode = args.route_mode
+    results = []
+    for model in args.models.split(","):
+        for size in [int(size) for size in args.sizes.split(",")]:
+            for backend in args.backends.split(","):
+                # mute the prints of Nettopo
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    result = run_case(model, size, backend, args)
+                results.append(result)
+                print("{} {} nodes {}: route p50 {:.3f}ms p99 {:.3f}ms".format(
+                    model, size, backend,
+                    result["operations"]["route"]["p50_ms"] or 0,
+                    result["operations"]["route"]["p99_ms"] or 0
+                ))
+                gc.collect()
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "networkx": nx.__version__,
+            "args": vars(args)
+        },
+        "results": results
+    }
+    with open(args.output, "w") as fs:
+        json.dump(report, fs, indent=2)
+    print("the results are written to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
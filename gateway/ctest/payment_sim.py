@@ -0,0 +1,184 @@
+# coding: utf-8
+"""
+in-process payment workload simulator\n
+a Nettopo with per-channel balances is built from a synthetic graph, then a
+stream of payments is routed by utils.search_route_for_wallet and settled
+hop by hop the way HTLC does: every hop must lock the forwarded amount(the
+payment plus the fees of the downstream nodes) before any balance moves,
+then each channel shifts the locked amount from payer to payee(RSMC)\n
+the settled balances are synced to the topology with update_data unless
+--stale-balance, no network is used\n
+usage(in the gateway directory):\n
+    python ctest/payment_sim.py --nodes 2000 --payments 5000 --router-count 3 --output sim.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import contextlib
+sys.path.append(os.getcwd())
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import topo
+import utils
+from bench_topo import MODELS, build_topo, percentile
+
+
+class Ledger(object):
+    """
+    the real channel balances: {channel name: {public key: balance}}
+    """
+    def __init__(self, net_topo):
+        self.net_topo = net_topo
+        self.channels = {}
+        for pk in net_topo.get_nodes():
+            for name, balance in net_topo.get_node_dict(pk)["Balance"].items():
+                self.channels.setdefault(name, {})[pk] = balance
+        # {(u, v): channel name} of both directions
+        self.names = {}
+        data = net_topo.to_json()
+        for link in data.get("links", data.get("edges", [])):
+            self.names[(link["source"], link["target"])] = link["name"]
+            self.names[(link["target"], link["source"])] = link["name"]
+
+    def channel(self, u, v):
+        return self.names[(u, v)]
+
+    def settle(self, path, amount, sync=True):
+        """
+        :param path: list of public keys from payer to payee\n
+        :return: (True, total fee) or (False, index of the failed hop)
+        """
+        fees = [self.net_topo.get_node_dict(pk)["Fee"] for pk in path[1:-1]]
+        hops = []
+        for i, (u, v) in enumerate(zip(path, path[1:])):
+            # the hop forwards the amount and the fees of the downstream nodes
+            forward = amount + sum(fees[i:])
+            name = self.channel(u, v)
+            if self.channels.get(name, {}).get(u, 0) < forward:
+                return False, i
+            hops.append((name, u, v, forward))
+        for name, u, v, forward in hops:
+            self.channels[name][u] -= forward
+            self.channels[name][v] = self.channels[name].get(v, 0) + forward
+            if sync:
+                self.net_topo.update_data({"Publickey": u, "Balance": {name: self.channels[name][u]}})
+                self.net_topo.update_data({"Publickey": v, "Balance": {name: self.channels[name][v]}})
+        return True, sum(fees)
+
+
+def make_payments(pks, count, rand, args):
+    """
+    :return: list of (payer, payee, amount), the payees follow the zipf like
+    popularity when --skew > 0
+    """
+    weights = [1.0 / (i + 1) ** args.skew for i in range(len(pks))]
+    payees = list(pks)
+    rand.shuffle(payees)
+    payments = []
+    for _ in range(count):
+        payer = rand.choice(pks)
+        payee = rand.choices(payees, weights)[0]
+        while payee == payer:
+            payee = rand.choice(pks)
+        amount = round(min(args.max_amount, rand.lognormvariate(args.amount_mu, args.amount_sigma)), 2)
+        payments.append((payer, payee, max(amount, 0.01)))
+    return payments
+
+
+async def simulate(net_topo, ledger, payments, args):
+    stats = {
+        "payments": len(payments),
+        "success": 0,
+        "no_route": 0,
+        "insufficient_balance": 0,
+        "retries": 0,
+        "hops": [],
+        "fees": [],
+        "amount_sent": 0,
+        "route_ms": []
+    }
+    for payer, payee, amount in payments:
+        sender = payer + "@" + net_topo.get_node_dict(payer)["Ip"]
+        receiver = payee + "@" + net_topo.get_node_dict(payee)["Ip"]
+        start = time.perf_counter()
+        routers = await utils.search_route_for_wallet(
+            sender, receiver, net_topo, "TNC", "bench", amount, args.router_count or None
+        )
+        stats["route_ms"].append((time.perf_counter() - start) * 1000)
+        if not args.router_count:
+            routers = [routers] if routers else []
+        if not routers:
+            stats["no_route"] += 1
+            continue
+        # the wallet retries the alternative routers in order
+        for i, router in enumerate(routers):
+            path = [utils.get_public_key(url) for url, _ in router["FullPath"]]
+            ok, fee = ledger.settle(path, amount, sync=not args.stale_balance)
+            if ok:
+                stats["success"] += 1
+                stats["retries"] += i
+                stats["hops"].append(len(path) - 1)
+                stats["fees"].append(fee)
+                stats["amount_sent"] += amount
+                break
+        else:
+            stats["insufficient_balance"] += 1
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="payment workload simulator")
+    parser.add_argument("--model", default="scale-free", choices=list(MODELS.keys()))
+    parser.add_argument("--nodes", type=int, default=2000)
+    parser.add_argument("--backend", default="networkx", choices=["networkx", "compact"])
+    parser.add_argument("--route-mode", default=topo.cg_route_mode, choices=["dijkstra", "alt"])
+    parser.add_argument("--payments", type=int, default=5000)
+    parser.add_argument("--router-count", type=int, default=0, help="alternative routers the wallet retries, 0 only the best")
+    parser.add_argument("--amount-mu", type=float, default=1.5, help="mu of the lognormal payment amount")
+    parser.add_argument("--amount-sigma", type=float, default=1.0)
+    parser.add_argument("--max-amount", type=float, default=100)
+    parser.add_argument("--skew", type=float, default=1.0, help="zipf exponent of the payee popularity, 0 uniform")
+    parser.add_argument("--stale-balance", action="store_true", help="don't sync the settled balances to the topology")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    topo.cg_route_mode = args.route_mode
+    rand = random.Random(args.seed)
+    loop = asyncio.get_event_loop()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        net_topo, pks, _ = build_topo(args.backend, MODELS[args.model](args.nodes, args.seed), rand, "TNC-bench")
+        net_topo.magic = "bench"
+        ledger = Ledger(net_topo)
+        online = [pk for pk in pks if net_topo.get_node_dict(pk)["Status"]]
+        payments = make_payments(online, args.payments, rand, args)
+        start = time.perf_counter()
+        stats = loop.run_until_complete(simulate(net_topo, ledger, payments, args))
+        seconds = time.perf_counter() - start
+    succeeded = stats["success"] or 1
+    report = {
+        "args": vars(args),
+        "edges": net_topo.get_number_of_edges(),
+        "seconds": seconds,
+        "throughput": stats["payments"] / seconds if seconds else None,
+        "success_rate": stats["success"] / stats["payments"] if stats["payments"] else None,
+        "success": stats["success"],
+        "no_route": stats["no_route"],
+        "insufficient_balance": stats["insufficient_balance"],
+        "avg_retries": stats["retries"] / succeeded,
+        "avg_hops": sum(stats["hops"]) / succeeded,
+        "avg_fee": sum(stats["fees"]) / succeeded,
+        "amount_sent": stats["amount_sent"],
+        "route_p50_ms": percentile(stats["route_ms"], 50),
+        "route_p99_ms": percentile(stats["route_ms"], 99)
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as fs:
+            json.dump(report, fs, indent=2)
+
+
+if __name__ == "__main__":
+    main()
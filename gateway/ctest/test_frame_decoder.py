@@ -0,0 +1,177 @@
+# coding: utf-8
+"""
+the frame decoder resync and the send backpressure of the tcp protocol\n
+usage(in the gateway directory):\n
+    python -m pytest ctest/test_frame_decoder.py
+"""
+import os
+import sys
+import asyncio
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import codec
+from codec import FrameDecoder, FrameError, encode_frame, decode_body
+from network import tcp
+from network.tcp import TProtocol
+from network.network import Network
+from config import cg_tcp_send_high_water
+
+
+class FrameDecoderTest(unittest.TestCase):
+
+    def decode_all(self, decoder):
+        messages = []
+        while True:
+            try:
+                for version, body in decoder.frames():
+                    messages.append(decode_body(version, body))
+                return messages
+            except FrameError:
+                decoder.resync()
+
+    def test_chunked_frames(self):
+        data = b"".join(encode_frame({"Index": i}) for i in range(10))
+        decoder = FrameDecoder(1024)
+        messages = []
+        for i in range(0, len(data), 7):
+            decoder.feed(data[i:i + 7])
+            messages.extend(self.decode_all(decoder))
+        self.assertEqual([{"Index": i} for i in range(10)], messages)
+        self.assertEqual(0, len(decoder.buffer) - decoder.offset)
+
+    def test_resync_after_garbage(self):
+        decoder = FrameDecoder(1024)
+        decoder.feed(encode_frame({"Index": 0}) + b"\x00garbage" * 3 + encode_frame({"Index": 1}))
+        self.assertEqual([{"Index": 0}, {"Index": 1}], self.decode_all(decoder))
+
+    def test_resync_keeps_partial_header(self):
+        decoder = FrameDecoder(1024)
+        frame = encode_frame({"Index": 1})
+        decoder.feed(b"garbage-garbage" + frame[:5])
+        self.assertEqual([], self.decode_all(decoder))
+        decoder.feed(frame[5:])
+        self.assertEqual([{"Index": 1}], self.decode_all(decoder))
+
+    def test_oversized_frame(self):
+        decoder = FrameDecoder(16)
+        decoder.feed(encode_frame({"Index": "x" * 32}) + encode_frame({"I": 2}))
+        with self.assertRaises(FrameError):
+            list(decoder.frames())
+        self.assertGreater(decoder.resync(), 0)
+        self.assertEqual([{"I": 2}], self.decode_all(decoder))
+
+
+class FakeTransport(asyncio.Transport):
+
+    def __init__(self, peername):
+        super().__init__()
+        self.peername = peername
+        self.written = 0
+        self.reading = True
+        self.closing = False
+
+    def get_extra_info(self, name, default=None):
+        return self.peername if name == "peername" else default
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def writelines(self, frames):
+        self.written += sum(len(frame) for frame in frames)
+
+    def pause_reading(self):
+        self.reading = False
+
+    def resume_reading(self):
+        self.reading = True
+
+    def is_closing(self):
+        return self.closing
+
+    def close(self):
+        self.closing = True
+
+
+class SendBackpressureTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.slow = self.connect(("10.0.0.1", 8089))
+        self.source = self.connect(("10.0.0.2", 8089))
+        self.frame = b"x" * (cg_tcp_send_high_water // 2 + 1)
+
+    def tearDown(self):
+        for protocol in (self.slow, self.source):
+            tcp.tcp_manager.unregister(protocol)
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def connect(self, peername):
+        protocol = TProtocol()
+        protocol.connection_made(FakeTransport(peername))
+        return protocol
+
+    def test_drain_after_resume_writing(self):
+        self.slow.pause_writing()
+        self.assertTrue(self.slow.send(self.frame))
+        self.assertTrue(self.slow.send(self.frame))
+        self.assertFalse(self.slow.writable())
+        drained = self.loop.create_task(self.slow.drain())
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertFalse(drained.done())
+        self.slow.resume_writing()
+        self.loop.run_until_complete(drained)
+        self.assertTrue(self.slow.writable())
+        self.assertEqual(2 * len(self.frame), self.slow.transport.written)
+
+    def test_bound_under_keep_policy(self):
+        self.slow.pause_writing()
+        sent = [self.slow.send(self.frame) for _ in range(10)]
+        self.assertEqual([True] * 7 + [False] * 3, sent)
+        self.assertLessEqual(self.slow.queued_bytes, tcp.max_queued_bytes)
+        self.assertFalse(self.slow.transport.closing)
+
+    def test_accept_large_frame_by_empty_queue(self):
+        large_frame = b"x" * (tcp.max_queued_bytes + 1)
+        self.slow.pause_writing()
+        self.assertTrue(self.slow.send(large_frame))
+        self.assertFalse(self.slow.send(self.frame))
+        self.slow.resume_writing()
+        self.assertEqual(len(large_frame), self.slow.transport.written)
+        self.assertTrue(self.slow.send(large_frame))
+
+    def test_throttle_the_relaying_peer(self):
+        self.slow.pause_writing()
+        tcp.receiving_protocol = self.source
+        try:
+            self.slow.send(self.frame)
+            self.slow.send(self.frame)
+        finally:
+            tcp.receiving_protocol = None
+        self.assertFalse(self.source.transport.reading)
+        self.slow.resume_writing()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertTrue(self.source.transport.reading)
+        self.assertEqual(set(), self.source.throttled_by)
+
+    def test_forward_whole_frame(self):
+        from gateway import gateway_singleton
+        self.slow.peer_codecs = {"json", "envelope"}
+        gateway_singleton.tcp_pk_dict["forward-pk"] = self.slow
+        try:
+            self.slow.pause_writing()
+            while self.slow.queued_bytes + len(self.frame) <= tcp.max_queued_bytes:
+                self.slow.send(self.frame)
+            queued = list(self.slow.send_queue)
+            body = codec.encode_frame({"MessageType": "Rsmc"}, envelope=True)[codec.HEADER_SIZE:]
+            body += b" " * (tcp.max_queued_bytes - self.slow.queued_bytes)
+            version = codec.JSON_VERSION | codec.ENVELOPE_FLAG << 16
+            self.assertFalse(Network.forward_frame_with_tcp("forward-pk@10.0.0.1:8089", version, body))
+            self.assertEqual(queued, list(self.slow.send_queue))
+        finally:
+            del gateway_singleton.tcp_pk_dict["forward-pk"]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+# coding: utf-8
+"""
+the flooded SyncChannelState are dropped by MessageId, except the graph sync
+ones which are made for this gateway by every sender\n
+usage(in the gateway directory):\n
+    python -m pytest ctest/test_message_id.py
+"""
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import codec
+from gateway import Gateway
+from message import MessageIdSet
+from ctest.test_topo import make_topo
+
+
+class MessageIdSetTest(unittest.TestCase):
+
+    def test_check_and_add(self):
+        seen = MessageIdSet(max_size=8)
+        self.assertFalse(seen.check_and_add("m1"))
+        self.assertTrue(seen.check_and_add("m1"))
+        # the messages without id are never dropped
+        self.assertFalse(seen.check_and_add(None))
+        self.assertFalse(seen.check_and_add(None))
+        self.assertEqual(1, seen.drop_times)
+
+    def test_bounded_lru(self):
+        seen = MessageIdSet(max_size=3)
+        for message_id in ["m1", "m2", "m3"]:
+            seen.check_and_add(message_id)
+        # m1 is used again, m2 is the oldest now
+        self.assertTrue(seen.check_and_add("m1"))
+        seen.check_and_add("m4")
+        self.assertEqual(3, len(seen.message_ids))
+        self.assertTrue(seen.check_and_add("m1"))
+        self.assertFalse(seen.check_and_add("m2"))
+
+
+class FakeTransport(object):
+
+    def get_extra_info(self, name, default=None):
+        return ("10.0.4.9", 51000) if name == "peername" else default
+
+
+class FakeProtocol(object):
+
+    def __init__(self):
+        self.transport = FakeTransport()
+
+
+class SyncChannelStateDedupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.gateway = Gateway()
+        self.protocol = FakeProtocol()
+        self.pks = ["dedup-pk{}".format(i) for i in range(3)]
+        net_topo = make_topo(self.pks, "TNCdedup", "dedup")
+        self.gateway.net_topos[net_topo.network_trait] = net_topo
+        self.net_topo = net_topo
+
+    def receive(self, message_id, sync_type, body):
+        # relayed by the gateway of other ip than the sender, no broadcast
+        message = {
+            "MessageType": "SyncChannelState",
+            "SyncType": sync_type,
+            "MessageId": message_id,
+            "Sender": "{}@10.0.4.1:8089".format(self.pks[1]),
+            "Receiver": "{}@10.0.4.0:8089".format(self.pks[0]),
+            "AssetType": "TNC",
+            "NetMagic": "dedup",
+            "Broadcast": False,
+            "Source": "{}@10.0.4.1:8089".format(self.pks[1]),
+            "Target": "{}@10.0.4.0:8089".format(self.pks[0]),
+            "MessageBody": body
+        }
+        self.gateway.handle_node_request(self.protocol, codec.dumps(message))
+
+    def test_drop_the_duplicated_node_data(self):
+        self.receive("dedup-m1", "update_node_data", {"Publickey": self.pks[2], "Fee": 3})
+        self.assertEqual(3, self.net_topo.get_node_dict(self.pks[2])["Fee"])
+        self.receive("dedup-m1", "update_node_data", {"Publickey": self.pks[2], "Fee": 5})
+        self.assertEqual(3, self.net_topo.get_node_dict(self.pks[2])["Fee"])
+        self.receive("dedup-m2", "update_node_data", {"Publickey": self.pks[2], "Fee": 5})
+        self.assertEqual(5, self.net_topo.get_node_dict(self.pks[2])["Fee"])
+
+    def test_apply_the_duplicated_graph_sync(self):
+        self.receive("dedup-m3", "apply_delta", {"Operations": []})
+        self.assertTrue(self.net_topo.has_edge(self.pks[1], self.pks[0]))
+        operations = [["add_edge", self.pks[1], self.pks[2]]]
+        self.receive("dedup-m3", "apply_delta", {"Operations": operations})
+        self.assertTrue(self.net_topo.has_edge(self.pks[1], self.pks[2]))
+
+
+if __name__ == "__main__":
+    unittest.main()
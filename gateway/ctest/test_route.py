@@ -0,0 +1,130 @@
+# coding: utf-8
+"""
+the route search ranked by fee, with the off-line nodes and the channels
+can't carry the amount pruned, on every graph backend and route mode\n
+usage(in the gateway directory):\n
+    python -m pytest ctest/test_route.py
+"""
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import topo
+from topo import Nettopo
+from compacttopo import CompactNettopo
+from ctest.test_topo import make_node_data
+
+# the fee of the nodes, the cheapest route S-F-G-T has the most hops
+FEES = {"S": 1, "A": 1, "B": 2, "F": 0, "G": 0, "T": 1}
+CHANNELS = [("S", "A"), ("A", "T"), ("S", "B"), ("B", "T"), ("S", "F"), ("F", "G"), ("G", "T")]
+
+
+def make_route_topo(name, topo_class=Nettopo, balance=100, status=None):
+    """
+    every node has the balance in all its channels, the pk is route-<name>-<node>\n
+    :param status: {node: Status} the nodes not online
+    """
+    net_topo = topo_class()
+    net_topo.magic = "route"
+    # the route cache is keyed by the trait
+    net_topo.network_trait = "TNCroute-{}-{}".format(name, topo_class.__name__)
+    status = status or {}
+    for i, node in enumerate(sorted(FEES)):
+        channels = {"{}-{}".format(u, v): balance for u, v in CHANNELS if node in (u, v)}
+        net_topo.add_node(make_node_data(
+            pk(name, node), i, fee=FEES[node], Balance=channels, Status=status.get(node, 1)))
+    for u, v in CHANNELS:
+        net_topo.add_edge(pk(name, u), pk(name, v))
+    return net_topo
+
+
+def pk(name, node):
+    return "route-{}-{}".format(name, node)
+
+
+def url(name, node):
+    return "{}@10.0.1.1:8089".format(pk(name, node))
+
+
+class RouteSearchTest(unittest.TestCase):
+
+    backends = [(Nettopo, "dijkstra"), (Nettopo, "alt"), (CompactNettopo, "dijkstra")]
+
+    def setUp(self):
+        self.route_mode = topo.cg_route_mode
+
+    def tearDown(self):
+        topo.cg_route_mode = self.route_mode
+
+    def each_backend(self, check):
+        """
+        :param check: function(topo_class, name) run for every backend
+        """
+        for topo_class, route_mode in self.backends:
+            with self.subTest(topo_class=topo_class.__name__, route_mode=route_mode):
+                topo.cg_route_mode = route_mode
+                check(topo_class, "{}-{}".format(self.id().split(".")[-1], route_mode))
+
+    def search(self, net_topo, name, amount=None):
+        path = net_topo.find_shortest_path_decide_by_fee(url(name, "S"), url(name, "T"), amount)
+        return [node.split("-")[-1] for node in path]
+
+    def test_ranked_by_fee(self):
+        def check(topo_class, name):
+            net_topo = make_route_topo(name, topo_class)
+            self.assertEqual(["S", "F", "G", "T"], self.search(net_topo, name))
+        self.each_backend(check)
+
+    def test_prune_offline_node(self):
+        def check(topo_class, name):
+            net_topo = make_route_topo(name, topo_class, status={"G": 0})
+            self.assertEqual(["S", "A", "T"], self.search(net_topo, name))
+            # the node comes back online
+            net_topo.update_data({"Publickey": pk(name, "G"), "Status": 1})
+            self.assertEqual(["S", "F", "G", "T"], self.search(net_topo, name))
+        self.each_backend(check)
+
+    def test_prune_underfunded_channel(self):
+        def check(topo_class, name):
+            net_topo = make_route_topo(name, topo_class)
+            net_topo.update_data({"Publickey": pk(name, "F"), "Balance": {"F-G": 3}})
+            self.assertEqual(["S", "F", "G", "T"], self.search(net_topo, name, 3))
+            self.assertEqual(["S", "A", "T"], self.search(net_topo, name, "5"))
+            self.assertEqual([], self.search(net_topo, name, 1000))
+        self.each_backend(check)
+
+    def test_edge_before_node_data(self):
+        def check(topo_class, name):
+            net_topo = make_route_topo(name, topo_class, status={"G": 0})
+            # add_single_edge of the unknown node, its data arrives later
+            net_topo.add_edge(pk(name, "S"), pk(name, "X"))
+            net_topo.merge_graph_data({"nodes": [dict(make_node_data(
+                pk(name, "X"), 9, fee=0, Balance={"S-X": 100, "X-T": 100}), id=pk(name, "X"))], "links": []})
+            net_topo.add_edge(pk(name, "X"), pk(name, "T"))
+            self.assertEqual(["S", "X", "T"], self.search(net_topo, name))
+        self.each_backend(check)
+
+    def test_k_shortest_paths(self):
+        def check(topo_class, name):
+            net_topo = make_route_topo(name, topo_class)
+            paths = net_topo.find_k_shortest_paths_decide_by_fee(url(name, "S"), url(name, "T"), 5)
+            self.assertEqual(
+                [["S", "F", "G", "T"], ["S", "A", "T"], ["S", "B", "T"]],
+                [[node.split("-")[-1] for node in path] for path in paths]
+            )
+            paths = net_topo.find_k_shortest_paths_decide_by_fee(url(name, "S"), url(name, "T"), 2, 1000)
+            self.assertEqual([], paths)
+        self.each_backend(check)
+
+    def test_among_sources_and_targets(self):
+        def check(topo_class, name):
+            net_topo = make_route_topo(name, topo_class, status={"F": 0})
+            path = net_topo.find_shortest_path_among([url(name, "S"), url(name, "B")], [url(name, "T")])
+            self.assertEqual(["B", "T"], [node.split("-")[-1] for node in path])
+            path = net_topo.find_shortest_path_among([url(name, "S")], [url(name, "A"), url(name, "G")])
+            self.assertEqual(["S", "A"], [node.split("-")[-1] for node in path])
+        self.each_backend(check)
+
+
+if __name__ == "__main__":
+    unittest.main()
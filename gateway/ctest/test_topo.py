@@ -0,0 +1,183 @@
+# coding: utf-8
+"""
+the node data updates and the delta sync of the topology\n
+usage(in the gateway directory):\n
+    python -m pytest ctest/test_topo.py
+"""
+import os
+import sys
+import asyncio
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import topo
+from topo import Nettopo
+from compacttopo import CompactNettopo
+from noderegistry import node_registry
+
+
+def make_topo(pks, network_trait="TNCtest", magic="test", topo_class=None):
+    """
+    the node data template of the ctest tests and benchmarks is make_node_data\n
+    :param topo_class: the backend selected by cg_topo_backend if None
+    """
+    net_topo = topo_class() if topo_class else Nettopo.create()
+    net_topo.magic = magic
+    net_topo.network_trait = network_trait
+    for i, pk in enumerate(pks):
+        net_topo.add_node(make_node_data(pk, i))
+    return net_topo
+
+
+def make_node_data(pk, index, fee=1, **attrs):
+    """
+    :param attrs: the node attributes replace the defaults
+    """
+    data = {
+        "Publickey": pk,
+        "Name": pk,
+        "AssetType": "TNC",
+        "Fee": fee,
+        "Balance": {},
+        "Ip": "10.0.1.{}:8089".format(index),
+        "WalletIp": "",
+        "Status": 1
+    }
+    data.update(attrs)
+    return data
+
+
+class UpdateDataTest(unittest.TestCase):
+
+    def test_skip_the_unknown_node(self):
+        net_topo = make_topo(["upd-pk0", "upd-pk1"])
+        net_topo.update_data([
+            {"Publickey": "upd-unknown", "Fee": 3},
+            {"Publickey": "upd-pk0", "Fee": 4},
+            {"Publickey": "upd-pk1", "Fee": 5}
+        ])
+        self.assertEqual(4, net_topo.get_node_dict("upd-pk0")["Fee"])
+        self.assertEqual(5, net_topo.get_node_dict("upd-pk1")["Fee"])
+
+
+class DeltaSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pks = ["delta-pk{}".format(i) for i in range(6)]
+        self.source = make_topo(self.pks[:3])
+        self.source.add_edge(self.pks[0], self.pks[1])
+        # the other magic keeps the replica's shared attributes apart
+        self.replica = make_topo([], magic="replica")
+
+    def sync(self, peer="10.0.2.1:8089"):
+        sync_type, body = self.source.make_sync_body(peer)
+        if sync_type == "add_whole_graph":
+            self.replica.merge_graph_data(body)
+        else:
+            self.replica.apply_operations(body["Operations"])
+        return sync_type, body
+
+    def assertConverged(self):
+        self.assertEqual(set(self.source.get_nodes()), set(self.replica.get_nodes()))
+        for pk in self.source.get_nodes():
+            self.assertEqual(dict(self.source.get_node_dict(pk)), dict(self.replica.get_node_dict(pk)))
+        edges = lambda net_topo: {frozenset((u, v)) for u, v, _ in net_topo.show_edgelist()}
+        self.assertEqual(edges(self.source), edges(self.replica))
+
+    def test_operations_since(self):
+        epoch, version = self.source.epoch, self.source.version
+        self.source.add_node(make_node_data(self.pks[3], 3, fee=2))
+        self.source.add_edge(self.pks[1], self.pks[3])
+        self.source.update_data({"Publickey": self.pks[0], "Fee": 3})
+        operations = self.source.operations_since(epoch, version)
+        self.assertEqual(["add_node", "add_edge", "update_node"], [operation[0] for operation in operations])
+        self.assertEqual([], self.source.operations_since(epoch, self.source.version))
+        self.assertIsNone(self.source.operations_since("other-epoch", version))
+        self.assertIsNone(self.source.operations_since(epoch, self.source.version + 1))
+
+    def test_operations_since_truncated_or_not_replayable(self):
+        epoch, version = self.source.epoch, self.source.version
+        for fee in range(self.source.mutation_log.maxlen + 1):
+            self.source.update_data({"Publickey": self.pks[0], "Fee": fee + 2})
+        self.assertIsNone(self.source.operations_since(epoch, version))
+        version = self.source.version
+        self.source.bump_version()
+        self.assertIsNone(self.source.operations_since(epoch, version))
+
+    def test_delta_converges(self):
+        self.assertEqual("add_whole_graph", self.sync()[0])
+        self.assertConverged()
+        self.source.add_node(make_node_data(self.pks[3], 3, fee=2))
+        self.source.add_edge(self.pks[2], self.pks[3])
+        self.source.update_data({"Publickey": self.pks[1], "Fee": 4, "Status": 0})
+        self.source.remove_edge(self.pks[0], self.pks[1])
+        sync_type, body = self.sync()
+        self.assertEqual("apply_delta", sync_type)
+        self.assertEqual(4, len(body["Operations"]))
+        self.assertConverged()
+        # nothing new since the last sync
+        self.assertEqual(("apply_delta", {"Operations": []}), self.source.make_sync_body("10.0.2.1:8089"))
+
+    def test_forget_peer(self):
+        self.sync()
+        self.source.add_edge(self.pks[1], self.pks[2])
+        self.source.forget_peer("10.0.2.1")
+        self.assertEqual("add_whole_graph", self.sync()[0])
+        self.assertConverged()
+
+
+class NodeRegistryTest(unittest.TestCase):
+
+    def test_attach_the_edge_endpoints(self):
+        for topo_class in (Nettopo, CompactNettopo):
+            with self.subTest(topo_class=topo_class.__name__):
+                net_topo = make_topo(["reg-pk0"], topo_class=topo_class)
+                net_topo.add_edge("reg-pk0", "reg-{}".format(topo_class.__name__))
+                self.assertIn(net_topo, node_registry.get_topos("reg-{}".format(topo_class.__name__)))
+
+    def test_shared_per_magic(self):
+        main_tnc = make_topo(["reg-shared"], "TNCmain", "main")
+        main_neo = make_topo(["reg-shared"], "NEOmain", "main")
+        test_tnc = make_topo(["reg-shared"], "TNCtest", "test")
+        main_tnc.update_data({"Publickey": "reg-shared", "Status": 0})
+        self.assertEqual(0, main_neo.get_node_dict("reg-shared")["Status"])
+        self.assertEqual(1, test_tnc.get_node_dict("reg-shared")["Status"])
+        self.assertEqual({main_tnc, main_neo}, set(node_registry.get_topos("reg-shared", "main")))
+        self.assertIn(("test", "reg-shared"), node_registry.find_by_ip("10.0.1.0"))
+
+
+class LandmarkRefreshTest(unittest.TestCase):
+
+    def setUp(self):
+        self.refresh_delay = topo.cg_landmark_refresh_delay
+        topo.cg_landmark_refresh_delay = 0
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        topo.cg_landmark_refresh_delay = self.refresh_delay
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def test_build_in_background(self):
+        pks = ["lm-pk{}".format(i) for i in range(20)]
+        net_topo = make_topo(pks)
+        for u, v in zip(pks, pks[1:]):
+            net_topo.add_edge(u, v)
+
+        async def refresh():
+            self.assertIsNone(net_topo.get_landmarks())
+            while net_topo._landmarks_scheduled:
+                await asyncio.sleep(0.01)
+            return net_topo.get_landmarks()
+        landmarks = self.loop.run_until_complete(refresh())
+        self.assertIsNotNone(landmarks)
+        self.assertEqual(net_topo.metric_version, landmarks.metric_version)
+        self.assertEqual(set(pks), set(landmarks.vectors))
+        # the fee changed, the table is stale until rebuilt
+        net_topo.update_data({"Publickey": pks[0], "Fee": 7})
+        landmarks = self.loop.run_until_complete(refresh())
+        self.assertEqual(net_topo.metric_version, landmarks.metric_version)
+
+
+if __name__ == "__main__":
+    unittest.main()
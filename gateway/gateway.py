@@ -1,14 +1,19 @@
 # coding: utf-8
 import time
 import os, socket
-import json
+import asyncio
 import utils
+import codec
 from _wallet import WalletClient
 from topo import Nettopo
+from noderegistry import node_registry
 from network import Network
-from message import Message, MessageMake
+from network.tcp import tcp_connector
+from message import Message, MessageMake, MessageIdSet
 from glog import tcp_logger, wst_logger, rpc_logger
-from config import cg_public_ip_port, cg_wsocket_addr
+from snapshot import load_snapshot, make_sections, write_snapshot, snapshot_executor
+from config import cg_public_ip_port, cg_wsocket_addr, cg_sync_coalesce_window,\
+ cg_snapshot_path, cg_snapshot_interval
 
 class Gateway:
     """
@@ -21,16 +26,81 @@ class Gateway:
         self.net_topos = {}
         self.ws_pk_dict = {}
         self.tcp_pk_dict = {}
+        # {network_trait: {"Message": message, "Nodes": {pk: node}, "Excepts": set}}
+        # the update_node_data messages waiting for the coalescing window
+        self.node_data_buffers = {}
+        # the broadcast message id: ip:port-boot time-sequence
+        self.message_id_prefix = "{}-{:x}".format(cg_public_ip_port, int(time.time()))
+        self.message_sequence = 0
+        self.seen_messages = MessageIdSet()
+        # {network_trait: (epoch, version)} of the last saved snapshot
+        self.snapshot_versions = {}
 
     def start(self):
+        self.load_snapshot()
         Network.create_servers()
         print("###### Trinity Gateway Start Successfully! ######")
         self.notifica_walelt_clis_on_line()
+        if cg_snapshot_interval:
+            Network.loop.call_later(cg_snapshot_interval, self.save_snapshot_periodically)
         Network.run_servers_forever()
 
     def clearn(self):
+        self.save_snapshot()
         Network.clearn_servers()
 
+    def load_snapshot(self):
+        """
+        load the topologies saved before shutdown, the peers send only the
+        operations after the received_sequences when channels resume
+        """
+        try:
+            count = load_snapshot(cg_snapshot_path, self.net_topos)
+        except Exception as ex:
+            tcp_logger.error("load snapshot {} failed: {}".format(cg_snapshot_path, ex))
+            return
+        for key, net_topo in self.net_topos.items():
+            self.snapshot_versions[key] = (net_topo.epoch, net_topo.version)
+        tcp_logger.info("load {} topologies from snapshot {}".format(count, cg_snapshot_path))
+
+    def save_snapshot(self):
+        """
+        save on shutdown, after the periodical one in the executor
+        """
+        versions = {key: (net_topo.epoch, net_topo.version) for key, net_topo in self.net_topos.items()}
+        if versions == self.snapshot_versions:
+            return
+        try:
+            sections = make_sections(self.net_topos)
+            snapshot_executor.submit(write_snapshot, cg_snapshot_path, sections).result()
+        except Exception as ex:
+            tcp_logger.error("save snapshot {} failed: {}".format(cg_snapshot_path, ex))
+        else:
+            self.snapshot_versions = versions
+
+    def save_snapshot_periodically(self):
+        """
+        only the section bytes are taken on the loop, the compression and the
+        file write run in the snapshot executor
+        """
+        Network.loop.call_later(cg_snapshot_interval, self.save_snapshot_periodically)
+        versions = {key: (net_topo.epoch, net_topo.version) for key, net_topo in self.net_topos.items()}
+        if versions == self.snapshot_versions:
+            return
+        try:
+            sections = make_sections(self.net_topos)
+        except Exception as ex:
+            tcp_logger.error("save snapshot {} failed: {}".format(cg_snapshot_path, ex))
+            return
+        future = Network.loop.run_in_executor(snapshot_executor, write_snapshot, cg_snapshot_path, sections)
+
+        def saved(future):
+            if future.exception():
+                tcp_logger.error("save snapshot {} failed: {}".format(cg_snapshot_path, future.exception()))
+            else:
+                self.snapshot_versions = versions
+        future.add_done_callback(saved)
+
     def close(self):
         Network.loop.close()
         print("###### Trinity Gateway Closed ######")
@@ -60,11 +130,9 @@ class Gateway:
         elif msg_type == "CombinationTransaction":
             pass
         elif msg_type == "GetRouterInfo":
-            net_topo = self.net_topos.get(utils.asset_type_magic_patch(asset_type, magic))
-            source = data.get("MessageBody").get("NodeList")
-            route = utils.search_route_for_spv(sender, source, receiver, net_topo, asset_type, magic)
-            message = MessageMake.make_ack_router_info_msg(route)
-            Network.send_msg_with_wsocket(websocket, message)
+            # the route search may wait for the remote gateway, do not block the loop
+            future = asyncio.ensure_future(self.handle_spv_router_request(websocket, data))
+            future.add_done_callback(lambda t: t.exception())
         elif msg_type == "GetNodeList":
             net_topo = self.net_topos.get(utils.asset_type_magic_patch(asset_type, magic))
             if net_topo:
@@ -85,10 +153,31 @@ class Gateway:
             wallet_addr = utils.get_wallet_addr(receiver, self.wallet_clients)
             Network.send_msg_with_jsonrpc("TransactionMessage", wallet_addr, data)
 
-    def handle_node_request(self, protocol, bdata):
+    async def handle_spv_router_request(self, websocket, data):
+        sender = data.get("Sender")
+        receiver = data.get("Receiver")
+        asset_type = data.get("AssetType")
+        magic = data.get("NetMagic")
+        net_topo = self.net_topos.get(utils.asset_type_magic_patch(asset_type, magic))
+        source = data.get("MessageBody").get("NodeList")
+        tx_amount = data.get("MessageBody").get("Value")
+        router_count = utils.parse_router_count(data.get("MessageBody").get("RouterCount"))
+        if router_count:
+            routers = await utils.search_route_for_spv(sender, source, receiver, net_topo, asset_type, magic, tx_amount, router_count)
+            message = MessageMake.make_ack_router_info_msg(routers[0] if routers else None, routers)
+        else:
+            route = await utils.search_route_for_spv(sender, source, receiver, net_topo, asset_type, magic, tx_amount)
+            message = MessageMake.make_ack_router_info_msg(route)
+        Network.send_msg_with_wsocket(websocket, message)
+
+    def handle_node_request(self, protocol, bdata, version=codec.JSON_VERSION):
         try:
-            data = utils.decode_bytes(bdata)
-        except UnicodeDecodeError:
+            # the relayed transaction message is routed by the envelope, not decoded
+            data = codec.read_envelope(version, bdata)
+            if not isinstance(data, dict) or data.get("MessageType") not in Message.get_tx_msg_types():
+                data = utils.decode_bytes(bdata, version=version)
+                version = None
+        except (UnicodeDecodeError, ValueError):
             return utils.request_handle_result.get("invalid")
         else:
             if not Message.check_message_is_valid(data):
@@ -98,11 +187,24 @@ class Gateway:
                 if msg_type == "RegisterKeepAlive":
                     protocol.is_wallet_cli = True
                     protocol.wallet_ip = data.get("Ip")
+                    # the old wallets don't send the codecs and can't read the ack
+                    if data.get("Codecs"):
+                        protocol.codec = codec.negotiate(data.get("Codecs"), utils.get_wire_codecs())
+                        protocol.peer_codecs = set(data.get("Codecs")) & set(utils.get_wire_codecs())
+                        message = MessageMake.make_ack_register_keep_alive(utils.get_wire_codecs())
+                        protocol.send(utils.encode_bytes(message))
                     if not len(self.net_topos.keys()):
                         ip, port = protocol.wallet_ip.split(":")
                         addr = (ip, int(port))
                         Network.send_msg_with_jsonrpc("GetChannelList", addr, {})
                     return
+                elif msg_type in ["NegotiateCodec", "AckNegotiateCodec"]:
+                    protocol.codec = codec.negotiate(data.get("Codecs"), utils.get_wire_codecs())
+                    protocol.peer_codecs = set(data.get("Codecs") or ()) & set(utils.get_wire_codecs())
+                    if msg_type == "NegotiateCodec":
+                        message = MessageMake.make_negotiate_codec_msg(utils.get_wire_codecs(), ack=True)
+                        protocol.send(utils.encode_bytes(message))
+                    return
 
                 # add debug here for investigate why the connection could not send the messages? connection broken??
                 try:
@@ -134,18 +236,26 @@ class Gateway:
                         connection_sock.setsockopt(socket.SOL_TCP, socket.TCP_KEEPIDLE, 90)
                         connection_sock.setsockopt(socket.SOL_TCP, socket.TCP_KEEPINTVL, 60)
                     self.tcp_pk_dict[sed_pk] = protocol
+                    tcp_connector.adopt(utils.get_addr(sender), protocol)
 
                 if msg_type == "RegisterChannel":
                     wallet_addr = utils.get_wallet_addr(receiver, self.wallet_clients)
                     Network.send_msg_with_jsonrpc("TransactionMessage", wallet_addr, data)
                 elif msg_type in Message.get_tx_msg_types():
-                    self.handle_transaction_message(data)
+                    self.handle_transaction_message(data, (version, bdata) if version is not None else None)
                     return utils.request_handle_result.get("correct")
                 elif msg_type == "ResumeChannel":
                     if not asset_type: return
                     net_topo = self.net_topos.get(utils.asset_type_magic_patch(asset_type, magic))
                     if not net_topo: return
                     if not sender or not receiver: return
+                    # the peer tells the graph log position it has received
+                    # then just send the operations it not yet seen
+                    peer = utils.get_ip_port(sender)
+                    if data.get("Epoch"):
+                        net_topo.peer_sequences[peer] = (data.get("Epoch"), data.get("Sequence"))
+                    else:
+                        net_topo.peer_sequences.pop(peer, None)
                     message = MessageMake.make_sync_graph_msg(
                         "add_whole_graph",
                         receiver,
@@ -154,33 +264,44 @@ class Gateway:
                         asset_type=asset_type,
                         magic=magic,
                         route_graph=net_topo,
-                        broadcast=False
+                        broadcast=False,
+                        peer=peer
                     )
                     message["Receiver"] = sender
                     Network.send_msg_with_tcp(sender, message)
                 elif msg_type == "SyncChannelState":
+                    sync_type = data.get("SyncType")
+                    duplicated = self.seen_messages.check_and_add(data.get("MessageId"))
+                    # drop the flooded duplicates before any graph work, but the graph
+                    # body is made for this gateway by every sender which has moved its
+                    # log position forward, so apply it and only skip the broadcast
+                    if duplicated and sync_type not in Message.get_graph_sync_types():
+                        tcp_logger.info("drop the duplicated sync message {}".format(data.get("MessageId")))
+                        return utils.request_handle_result.get("correct")
                     if receiver and asset_type and magic:
                         net_topo = self.net_topos.get(utils.asset_type_magic_patch(asset_type, magic))
-                        sync_type = data.get("SyncType")
                         # for solve node sync msg ahead wallet_cli sync msg
-                        if sync_type == "add_whole_graph":
+                        if sync_type in Message.get_graph_sync_types():
                             tpk = utils.get_public_key(data.get("Target"))
                             wallet = utils.get_all_active_wallet_dict(self.wallet_clients).get(tpk)
                             if wallet:
                                 Nettopo.add_or_update(self.net_topos, asset_type, magic, wallet)
                                 net_topo = self.net_topos.get(utils.asset_type_magic_patch(asset_type, magic))
                         elif not net_topo: return
-                        net_topo.sync_channel_graph(data)
-                        if sync_type == "add_whole_graph":
+                        changed = net_topo.sync_channel_graph(data)
+                        if sync_type in Message.get_graph_sync_types():
                             for nid in net_topo.get_nodes():
                                 node = net_topo.get_node_dict(nid)
                                 wallet_cli = self.wallet_clients.get(node["WalletIp"])
                                 opened_wallet = wallet_cli.opened_wallet if wallet_cli else None
                                 if node["Ip"] == cg_public_ip_port and not node["Status"] and opened_wallet:
-                                    node["Status"] = 1
+                                    net_topo.update_data({"Publickey": nid, "Status": 1})
                                     sync_node_data_to_peer(node, net_topo)
                         tcp_logger.info("sync graph from peer successful")
                         tcp_logger.info("**********number of edges is: {}**********".format(net_topo.get_number_of_edges()))
+                        if not changed or duplicated:
+                            tcp_logger.info("nothing changed by the sync graph or duplicated, skip the broadcast")
+                            return utils.request_handle_result.get("correct")
                         if data.get("Broadcast"):
                             data["Sender"] = receiver
                             self.sync_channel_route_to_peer(data)
@@ -189,20 +310,38 @@ class Gateway:
                         tcp_logger.error("!!!!!! the receiver or asset_type or magic not provied in the sync channel msg !!!!!!")
                         return
 
+    def make_message_id(self):
+        self.message_sequence += 1
+        return "{}-{:x}".format(self.message_id_prefix, self.message_sequence)
+
+    def forget_peer(self, ip):
+        """
+        the graph sync to the peer gateway maybe lost, send it the whole graph next time
+        """
+        for net_topo in self.net_topos.values():
+            net_topo.forget_peer(ip)
+
     def handle_node_off(self, peername):
         ip = str(peername[0])
-        for key in self.net_topos:
-            net_topo = self.net_topos[key]
-            for nid in net_topo.get_nodes():
-                node = net_topo.get_node_dict(nid)
-                if node["Ip"].split(":")[0] == ip:
-                    node["Status"] = 0
-                    sync_node_data_to_peer(node, net_topo)
+        self.forget_peer(ip)
+        # {network_trait: [node]} the off-line nodes broadcast in one message per topology
+        off_nodes = {}
+        for magic, pk in node_registry.find_by_ip(ip):
+            net_topos = [
+                net_topo for net_topo in node_registry.get_topos(pk, magic)
+                if self.net_topos.get(net_topo.network_trait) is net_topo
+            ]
+            if not net_topos or not net_topos[0].get_node_dict(pk)["Status"]: continue
+            net_topos[0].update_data({"Publickey": pk, "Status": 0})
+            for net_topo in net_topos:
+                off_nodes.setdefault(net_topo.network_trait, []).append(net_topo.get_node_dict(pk))
+        for network_trait, nodes in off_nodes.items():
+            sync_nodes_data_to_peer(nodes, self.net_topos[network_trait])
 
     def handle_wallet_request(self, method, params):
         data = params
         if type(data) == str:
-            data = json.loads(data)
+            data = codec.loads(data)
         msg_type = data.get("MessageType")
         if method == "Search":
             public_key = data.get("Publickey")
@@ -223,7 +362,7 @@ class Gateway:
             elif msg_type == "SearchSpv":
                 data = net_topo.spv_table.to_json()
                 message = MessageMake.make_ack_search_spv(data)
-            return json.dumps(message)
+            return codec.dumps_text(message)
 
         magic = data.get("NetMagic") if data.get("NetMagic") else ""
         if method == "SyncWalletData":
@@ -239,28 +378,13 @@ class Gateway:
             spv_ip_port = "{}:{}".format(cg_wsocket_addr[0], cg_wsocket_addr[1])
             response = MessageMake.make_ack_sync_wallet_msg(wallet.url, spv_ip_port)
             # self.detect_wallet_client_status()
-            return json.dumps(response)
+            return codec.dumps_text(response)
         elif method == "SyncBlock":
             sender = data.get("Sender")
             if utils.check_is_owned_wallet(sender, self.wallet_clients):
                 Network.add_event_push_web_task(data)
                 # self.detect_wallet_client_status()
             return "OK"
-        elif method == "GetRouterInfo":
-            rpc_logger.info("Get the wallet router info request:\n{}".format(data))
-            sender = data.get("Sender")
-            receiver = data.get("Receiver")
-            body = data.get("MessageBody")
-            asset_type = body.get("AssetType")
-            tx_amount = body.get("Value")
-            magic = data.get("NetMagic")
-            # check the wallet is attached this gatway
-            # if not do nothing
-            if not utils.check_is_owned_wallet(sender, self.wallet_clients):
-                return "wallet public key check failed"
-            net_topo = self.net_topos.get(utils.asset_type_magic_patch(asset_type, magic))
-            route = utils.search_route_for_wallet(sender, receiver, net_topo, asset_type, magic)
-            return json.dumps(MessageMake.make_ack_router_info_msg(route))
         elif method == "TransactionMessage":
             rpc_logger.info("Get the wallet tx message: {}".format(msg_type))
             rev = data.get("Receiver")
@@ -320,8 +444,10 @@ class Gateway:
                     receiver_balance = data["MessageBody"]["Balance"][channel_receiver][asset_type]
                     receiver_node = net_topo.get_node_dict(rid)
                     if founder_balance != founder_node["Balance"][channel_name]:
-                        founder_node["Balance"][channel_name] = founder_balance
-                        receiver_node["Balance"][channel_name] = receiver_balance
+                        net_topo.update_data([
+                            {"Publickey": fid, "Balance": {channel_name: founder_balance}},
+                            {"Publickey": rid, "Balance": {channel_name: receiver_balance}}
+                        ])
                         message = MessageMake.make_sync_graph_msg(
                             "update_node_data",
                             [channel_founder, channel_receiver],
@@ -332,7 +458,7 @@ class Gateway:
                             broadcast=True,
                             excepts = list(net_topo.nids)
                         )
-                        self.sync_channel_route_to_peer(message)
+                        self.coalesce_node_data_to_peer(message)
                 elif msg_type == "DeleteChannel":
                     result = net_topo.remove_edge(fid, rid)
                     if result:
@@ -381,7 +507,8 @@ class Gateway:
                         magic=magic,
                         route_graph=net_topo,
                         broadcast=True,
-                        excepts = [tid] + list(net_topo.nids)
+                        excepts = [tid] + list(net_topo.nids),
+                        peer=utils.get_ip_port(channel_peer)
                     )
                     message["Receiver"] = channel_peer
                     Network.send_msg_with_tcp(channel_peer, message)
@@ -391,7 +518,7 @@ class Gateway:
                     peer_balance = data["MessageBody"]["Balance"][channel_peer][asset_type]
                     source_node = net_topo.get_node_dict(sid)
                     if source_node["Balance"][channel_name] != source_balance:
-                        source_node["Balance"][channel_name] = source_balance
+                        net_topo.update_data({"Publickey": sid, "Balance": {channel_name: source_balance}})
                         message = MessageMake.make_sync_graph_msg(
                             "update_node_data",
                             channel_source,
@@ -402,7 +529,7 @@ class Gateway:
                             broadcast=True,
                             excepts = [tid] + list(net_topo.nids)
                         )
-                        self.sync_channel_route_to_peer(message)
+                        self.coalesce_node_data_to_peer(message)
                 elif msg_type == "DeleteChannel":
                     result = net_topo.remove_edge(sid, tid)
                     if result:
@@ -425,11 +552,39 @@ class Gateway:
             magic = data.get("NetMagic") if data.get("NetMagic") else ""
             self.handle_wallet_cli_off_line(cli_ip, magic=magic)
 
+    async def handle_wallet_router_request(self, params):
+        """
+        the GetRouterInfo request of wallet, it is a coroutine because
+        the route search may wait for the remote gateway
+        """
+        data = params
+        if type(data) == str:
+            data = codec.loads(data)
+        rpc_logger.info("Get the wallet router info request:\n{}".format(data))
+        sender = data.get("Sender")
+        receiver = data.get("Receiver")
+        body = data.get("MessageBody")
+        asset_type = body.get("AssetType")
+        tx_amount = body.get("Value")
+        magic = data.get("NetMagic")
+        # check the wallet is attached this gatway
+        # if not do nothing
+        if not utils.check_is_owned_wallet(sender, self.wallet_clients):
+            return "wallet public key check failed"
+        net_topo = self.net_topos.get(utils.asset_type_magic_patch(asset_type, magic))
+        # the wallet could retry with the alternative routers when RouterCount provided
+        router_count = utils.parse_router_count(body.get("RouterCount"))
+        if router_count:
+            routers = await utils.search_route_for_wallet(sender, receiver, net_topo, asset_type, magic, tx_amount, router_count)
+            return codec.dumps_text(MessageMake.make_ack_router_info_msg(routers[0] if routers else None, routers))
+        route = await utils.search_route_for_wallet(sender, receiver, net_topo, asset_type, magic, tx_amount)
+        return codec.dumps_text(MessageMake.make_ack_router_info_msg(route))
+
     def handle_wallet_response(self, method, response):
         if method == "GetChannelList":
             rpc_logger.info("Get the wallet channel list message:\n{}".format(response))
             if type(response) == str:
-                response = json.loads(response)
+                response = codec.loads(response)
             self.handle_channel_list_message(response)
 
     def handle_spv_make_connection(self, websocket):
@@ -447,26 +602,32 @@ class Gateway:
         network_trait = utils.asset_type_magic_patch(asset_type, magic)
         net_topo = self.net_topos.get(network_trait)
         sender = message.get("Sender")
-        if message.get("SyncType") == "add_whole_graph":
-            message["MessageBody"] = net_topo.to_json()
+        # the origin gateway assign the message id, peers drop the duplicates by it
+        if not message.get("MessageId"):
+            message["MessageId"] = self.make_message_id()
+            self.seen_messages.check_and_add(message["MessageId"])
+        # the graph body is made for every neighbor according to what it has seen
+        sync_graph = message.get("SyncType") in Message.get_graph_sync_types()
         # wallets in the same gateway first call(call in handle_wallet_request)
         set_neighbors = set()
         for nid in net_topo.nids:
             set_nid_neighbors = net_topo.get_neighbors_set(nid)
             set_neighbors = set_neighbors.union(set_nid_neighbors)
         set_neighbors = set_neighbors.difference(net_topo.nids)
-        set_excepts = set(message.get("Excepts"))
+        set_excepts = set(message.get("Excepts") or [])
         set_excepts = set_excepts.union(net_topo.nids)
-        union_excepts = set_excepts.union(set_neighbors)
-        if message.get("Receiver"):
-            union_excepts.add(utils.get_public_key(message["Receiver"]))
+        # only tell the neighbor not to send back to self's wallets,
+        # the Excepts don't grow hop by hop any more
+        local_excepts = list(net_topo.nids)
 
         for ner in set_neighbors:
             if ner not in set_excepts:
                 receiver = ner + "@" + net_topo.get_node_dict(ner)["Ip"]
                 tcp_logger.info("=== sync to the neighbor: {} ===".format(ner))
-                message["Excepts"] = list(union_excepts)
+                message["Excepts"] = local_excepts
                 message["Receiver"] = receiver
+                if sync_graph:
+                    _make_graph_sync_body(message, net_topo, receiver)
                 Network.send_msg_with_tcp(receiver, message)
 
         if not same_gateway:
@@ -478,11 +639,45 @@ class Gateway:
             for neighbor in node_attr.links:
                 receiver = neighbor + "@" + ip
                 tcp_logger.info("=== sync to the neighbor: {} ===".format(neighbor))
-                message["Excepts"] = list(union_excepts)
+                message["Excepts"] = local_excepts
                 message["Receiver"] = receiver
+                if sync_graph:
+                    _make_graph_sync_body(message, net_topo, receiver)
                 Network.send_msg_with_tcp(receiver, message)
 
 
+    def coalesce_node_data_to_peer(self, message):
+        """
+        merge the update_node_data messages of the same topology in the
+        coalescing window, then flush one consolidated message per neighbor\n
+        :param message: the update_node_data message
+        """
+        if not cg_sync_coalesce_window:
+            return self.sync_channel_route_to_peer(message)
+        network_trait = utils.asset_type_magic_patch(message.get("AssetType"), message.get("NetMagic"))
+        node_buffer = self.node_data_buffers.get(network_trait)
+        if not node_buffer:
+            node_buffer = {"Message": message, "Nodes": {}, "Excepts": set()}
+            self.node_data_buffers[network_trait] = node_buffer
+            Network.loop.call_later(cg_sync_coalesce_window, self.flush_node_data_to_peer, network_trait)
+        nodes = message["MessageBody"]
+        if isinstance(nodes, dict):
+            nodes = [nodes]
+        # the latest data of the node will be flushed
+        for node in nodes:
+            node_buffer["Nodes"][node["Publickey"]] = node
+        node_buffer["Excepts"].update(message.get("Excepts") or [])
+
+    def flush_node_data_to_peer(self, network_trait):
+        node_buffer = self.node_data_buffers.pop(network_trait, None)
+        if not node_buffer or not self.net_topos.get(network_trait):
+            return
+        message = node_buffer["Message"]
+        message["MessageBody"] = list(node_buffer["Nodes"].values())
+        message["Excepts"] = list(node_buffer["Excepts"])
+        tcp_logger.info("flush {} coalesced node data of {}".format(len(message["MessageBody"]), network_trait))
+        self.sync_channel_route_to_peer(message)
+
     def resume_channel_from_db(self):
         for pk, wallet in self.wallets.items():
             channels = utils.get_channels_form_db(wallet.url)
@@ -493,19 +688,31 @@ class Gateway:
                     if utils.get_ip_port(peer) != cg_public_ip_port:
                         Network.send_msg_with_tcp(peer, message)
 
-    def handle_transaction_message(self, data):
+    def handle_transaction_message(self, data, frame=None):
         """
-        :param data: bytes type
+        :param data: dict type, only the envelope keys if frame provided\n
+        :param frame: (version, body) of the received frame which has the envelope
         """
         receiver = data.get("Receiver")
-        sender = data.get("Sender")
-        asset_type = data.get("MessageBody").get("AssetType")
         receiver_pk = utils.get_public_key(receiver)
+        is_spv = utils.check_is_spv(receiver)
+        is_owned_wallet = not is_spv and utils.check_is_owned_wallet(receiver, self.wallet_clients)
+        if frame:
+            # relay to the peer as it is received
+            if not is_spv and not is_owned_wallet:
+                Network.forward_frame_with_tcp(receiver, *frame)
+                return
+            # the wallet and spv take the json text
+            try:
+                data = codec.payload_text(*frame) or utils.decode_bytes(frame[1], version=frame[0])
+            except (UnicodeDecodeError, ValueError):
+                tcp_logger.error("invalid transaction message to %s", receiver)
+                return
         # to spv
-        if utils.check_is_spv(receiver):
+        if is_spv:
             Network.send_msg_with_wsocket(self.ws_pk_dict.get(receiver_pk), data)
         # to self's wallet(wallets that attached this gateway)
-        elif utils.check_is_owned_wallet(receiver, self.wallet_clients):
+        elif is_owned_wallet:
             # pk = utils.get_public_key(receiver)
             wallet_addr = utils.get_wallet_addr(receiver, self.wallet_clients)
             Network.send_msg_with_jsonrpc("TransactionMessage", wallet_addr, data)
@@ -513,15 +720,37 @@ class Gateway:
         else:
             Network.send_msg_with_tcp(receiver, data)
 
+    def _get_node_topos(self, pk, magic=""):
+        """
+        :return: list of the net_topos include the node, found by the node registry
+        """
+        return [
+            net_topo for net_topo in node_registry.get_topos(pk)
+            if magic in (net_topo.network_trait or "") and self.net_topos.get(net_topo.network_trait) is net_topo
+        ]
+
+    @staticmethod
+    def _update_shared_data(net_topos, data):
+        """
+        the shared attributes are kept per magic, update once for the net_topos of each magic
+        """
+        magics = set()
+        for net_topo in net_topos:
+            if net_topo.magic not in magics:
+                magics.add(net_topo.magic)
+                net_topo.update_data(data)
+
     def _handle_switch_wallets(self, last_pk, magic):
         if not last_pk: return
-        for key in self.net_topos:
-            net_topo = self.net_topos[key]
-            if magic in key and last_pk in net_topo.nids:
-                node = net_topo.get_node_dict(last_pk)
-                if not node["Status"]: return
-                node["Status"] = 0
-                sync_node_data_to_peer(node, net_topo)
+        net_topos = [
+            net_topo for net_topo in self._get_node_topos(last_pk, magic)
+            if last_pk in net_topo.nids and net_topo.get_node_dict(last_pk)["Status"]
+        ]
+        if not net_topos: return
+        # the status is shared by the assets, update once and broadcast for each asset
+        self._update_shared_data(net_topos, {"Publickey": last_pk, "Status": 0})
+        for net_topo in net_topos:
+            sync_node_data_to_peer(net_topo.get_node_dict(last_pk), net_topo)
 
     def handle_wallet_cli_on_line(self, wallet, last_opened_wallet_pk, magic):
         """
@@ -539,15 +768,15 @@ class Gateway:
         pk = wallet.public_key
         self.wallet_clients[cli_ip].on_line()
         # self._handle_switch_wallets(last_opened_wallet_pk, magic)
-        for key in self.net_topos:
-            net_topo = self.net_topos[key]
-            if magic in key and net_topo.has_node(pk):
-                node = net_topo.get_node_dict(pk)
-                if node["Status"]: return
-                net_topo.nids.add(pk)
-                node["Status"] = 1
-                node["Ip"] = cg_public_ip_port
-                sync_node_data_to_peer(node, net_topo)
+        net_topos = [
+            net_topo for net_topo in self._get_node_topos(pk, magic)
+            if not net_topo.get_node_dict(pk)["Status"]
+        ]
+        if not net_topos: return
+        self._update_shared_data(net_topos, {"Publickey": pk, "Status": 1, "Ip": cg_public_ip_port})
+        for net_topo in net_topos:
+            net_topo.nids.add(pk)
+            sync_node_data_to_peer(net_topo.get_node_dict(pk), net_topo)
 
     def handle_wallet_cli_off_line(self, protocol, magic=""):
         """
@@ -565,16 +794,17 @@ class Gateway:
         del self.wallet_clients[cli_ip]
         # if the client not yet opened wallet do nothing
         if not pk: return
-        for key in self.net_topos:
-            net_topo = self.net_topos[key]
-            # first check the wallet in the net_topo
-            if magic in key and pk in net_topo.nids:
-                node = net_topo.get_node_dict(pk)
-                # check the wallet status is active
-                if not node["Status"]: return
-                node["Status"] = 0
-                sync_node_data_to_peer(node, net_topo)
-                net_topo.nids.remove(pk)
+        # first check the wallet in the net_topo
+        # check the wallet status is active
+        net_topos = [
+            net_topo for net_topo in self._get_node_topos(pk, magic)
+            if pk in net_topo.nids and net_topo.get_node_dict(pk)["Status"]
+        ]
+        if not net_topos: return
+        self._update_shared_data(net_topos, {"Publickey": pk, "Status": 0})
+        for net_topo in net_topos:
+            sync_node_data_to_peer(net_topo.get_node_dict(pk), net_topo)
+            net_topo.nids.remove(pk)
 
     def handle_channel_list_message(self, data):
         if data.get("MessageType") != "GetChannelList": return
@@ -609,7 +839,9 @@ class Gateway:
                     spv_list.append(utils.get_public_key(channel_peer))
                     continue
                 elif not utils.check_is_owned_wallet(channel_peer, self.wallet_clients):
-                    message = MessageMake.make_recover_channel_msg(wallet.url, channel_peer, asset_type, magic)
+                    net_topo = self.net_topos.get(utils.asset_type_magic_patch(asset_type, magic))
+                    sequence = net_topo.received_sequences.get(utils.get_ip_port(channel_peer)) if net_topo else None
+                    message = MessageMake.make_recover_channel_msg(wallet.url, channel_peer, asset_type, magic, sequence)
                     Network.send_msg_with_tcp(channel_peer, message)
             if len(wallet.channel_balance.keys()):
                 Nettopo.add_or_update(self.net_topos, asset_type, magic, wallet)
@@ -646,4 +878,31 @@ def sync_node_data_to_peer(node, net_topo):
         broadcast=True,
         excepts = list(net_topo.nids)
     )
-    gateway_singleton.sync_channel_route_to_peer(message)
\ No newline at end of file
+    gateway_singleton.coalesce_node_data_to_peer(message)
+
+def sync_nodes_data_to_peer(nodes, net_topo):
+    """
+    broadcast the data of nodes in one update_node_data message
+    """
+    url = nodes[0]["Publickey"] + "@" + cg_public_ip_port
+    message = MessageMake.make_sync_graph_msg(
+        "update_node_data",
+        url,
+        source=url,
+        asset_type=nodes[0]["AssetType"],
+        magic=net_topo.magic,
+        node=nodes,
+        broadcast=True,
+        excepts = list(net_topo.nids)
+    )
+    gateway_singleton.coalesce_node_data_to_peer(message)
+
+def _make_graph_sync_body(message, net_topo, receiver):
+    """
+    the whole graph or the delta operations that the receiver not yet seen
+    """
+    sync_type, body = net_topo.make_sync_body(utils.get_ip_port(receiver))
+    message["SyncType"] = sync_type
+    message["MessageBody"] = body
+    message["Epoch"] = net_topo.epoch
+    message["Sequence"] = net_topo.version
@@ -0,0 +1,111 @@
+# coding: utf-8
+"""
+the landmark(ALT) A* route search\n
+a few landmarks are selected by the farthest-first strategy and the fee
+distances from each landmark to all nodes are precomputed, by the triangle
+inequality |d(L, t) - d(L, v)| is a lower bound of d(v, t)\n
+the bound stays valid when edges are removed or hidden, the table must be
+rebuilt after edges added or fees changed(metric_version of Nettopo)
+"""
+import heapq
+import networkx as nx
+
+
+class LandmarkTable(object):
+    """
+    landmarks: list of public keys\n
+    distances: list of {public_key: fee distance from the landmark}\n
+    vectors: {public_key: tuple of the distances from every landmark}, inf if unreachable
+    """
+    def __init__(self, metric_version):
+        self.metric_version = metric_version
+        self.landmarks = []
+        self.distances = []
+        self.vectors = {}
+
+    @classmethod
+    def build(cls, graph, count, metric_version):
+        """
+        :param graph: networkx graph, the edge attribute "weight" is the fee\n
+        :param count: max number of the landmarks
+        """
+        table = cls(metric_version)
+        if not graph.number_of_nodes():
+            return table
+        # start from the hub, then the node farthest from the chosen landmarks
+        landmark = max(graph.degree, key=lambda item: item[1])[0]
+        nearest = {}
+        while landmark is not None and len(table.landmarks) < count:
+            distance = nx.single_source_dijkstra_path_length(graph, landmark, weight="weight")
+            table.landmarks.append(landmark)
+            table.distances.append(distance)
+            for pk, d in distance.items():
+                if d < nearest.get(pk, float("inf")):
+                    nearest[pk] = d
+            # the node of other components first, then the farthest one
+            landmark = None
+            for pk in graph.nodes:
+                if pk not in nearest:
+                    landmark = pk
+                    break
+            else:
+                farthest = max(nearest.items(), key=lambda item: item[1])
+                if farthest[1] > 0:
+                    landmark = farthest[0]
+        inf = float("inf")
+        for pk in graph.nodes:
+            table.vectors[pk] = tuple(distance.get(pk, inf) for distance in table.distances)
+        return table
+
+    def _make_heuristic(self, target):
+        inf = float("inf")
+        # only the landmarks reach the target give the bound
+        index = [i for i, dt in enumerate(self.vectors.get(target, ())) if dt != inf]
+        target_vector = [self.vectors[target][i] for i in index]
+        vectors = self.vectors
+        def heuristic(pk):
+            vector = vectors.get(pk)
+            if not index or vector is None:
+                return 0
+            h = max([abs(dt - vector[i]) for i, dt in zip(index, target_vector)])
+            # the landmark reach the target but not the node, no path
+            return None if h == inf else h
+        return heuristic
+
+    def shortest_path(self, graph, source, target, weight):
+        """
+        :param weight: weight function(u, v, edge), None means the edge is hidden\n
+        :return: type list, empty list if no path
+        """
+        if not graph.has_node(source) or not graph.has_node(target):
+            return []
+        heuristic = self._make_heuristic(target)
+        dist = {source: 0}
+        prev = {}
+        visited = set()
+        heap = [(heuristic(source) or 0, 0, source)]
+        while heap:
+            _, d, u = heapq.heappop(heap)
+            if u in visited:
+                continue
+            if u == target:
+                path = [u]
+                while path[-1] in prev:
+                    path.append(prev[path[-1]])
+                return list(reversed(path))
+            visited.add(u)
+            for v, edge in graph.adj[u].items():
+                if v in visited:
+                    continue
+                w = weight(u, v, edge)
+                if w is None:
+                    continue
+                nd = d + w
+                if nd < dist.get(v, float("inf")):
+                    h = heuristic(v)
+                    if h is None:
+                        continue
+                    dist[v] = nd
+                    prev[v] = u
+                    heapq.heappush(heap, (nd + h, nd, v))
+        return []
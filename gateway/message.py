@@ -2,6 +2,8 @@
 """
 the mudule for  message
 """
+from collections import OrderedDict
+from config import cg_seen_message_size
 
 class Message:
     """
@@ -43,6 +45,17 @@ class Message:
         ]
         return payment_types
 
+    @staticmethod
+    def get_graph_sync_types():
+        """
+        :return: the sync types that carry the graph
+        """
+        graph_sync_types = [
+            "add_whole_graph",
+            "apply_delta"
+        ]
+        return graph_sync_types
+
     # classmethods
     @classmethod
     def get_valid_msg_types(cls):
@@ -70,7 +83,7 @@ class Message:
             is_valid = False
         elif not msg_type:
             is_valid = False
-        if origin == "node" and msg_type != "RegisterKeepAlive":
+        if origin == "node" and msg_type not in ["RegisterKeepAlive", "NegotiateCodec", "AckNegotiateCodec"]:
             if msg_type not in cls.get_valid_msg_types():
                 is_valid = False
             elif not data.get("Sender"):
@@ -167,8 +180,25 @@ class MessageMake:
             }
         }
         return message
+
+    @staticmethod
+    def make_ack_register_keep_alive(codecs):
+        message = {
+            "MessageType": "AckRegisterKeepAlive",
+            "Codecs": codecs
+        }
+        return message
     ###### message for wallet end ########
 
+    @staticmethod
+    def make_negotiate_codec_msg(codecs, ack=False):
+        message = {
+            "MessageType": "AckNegotiateCodec" if ack else "NegotiateCodec",
+            "Codecs": codecs
+        }
+        return message
+
+
     ###### message for spv begin ########
     @staticmethod
     def make_node_list_msg(channel_graph):
@@ -189,7 +219,10 @@ class MessageMake:
 
     ###### message for node begin ########
     @staticmethod
-    def make_recover_channel_msg(sender, receiver, asset_type, magic):
+    def make_recover_channel_msg(sender, receiver, asset_type, magic, sequence=None):
+        """
+        :param sequence: (epoch, version) of the receiver's graph log that has been received
+        """
         message = {
             "MessageType": "ResumeChannel",
             "AssetType": asset_type,
@@ -197,6 +230,8 @@ class MessageMake:
             "Sender": sender,
             "Receiver": receiver
         }
+        if sequence:
+            message["Epoch"], message["Sequence"] = sequence
         return message
 
     @staticmethod
@@ -213,7 +248,8 @@ class MessageMake:
     def make_sync_graph_msg(sync_type, sender, msg_type="SyncChannelState" ,**kwargs):
         """
         :param sync_type: add_single_edge|remove_single_edge|update_node_data|add_whole_graph \n
-        :param kwargs: {route_graph,source,target,node,broadcast,excepts}
+        :param kwargs: {route_graph,source,target,node,broadcast,excepts,peer} \n
+        if peer(ip:port of the peer gateway) provided, add_whole_graph maybe downgrade to apply_delta
         """
         message = {
             "MessageType": msg_type,
@@ -227,22 +263,36 @@ class MessageMake:
             "Excepts": kwargs.get("excepts")
         }
         if sync_type == "add_whole_graph":
-            message["MessageBody"] = kwargs["route_graph"].to_json()
+            route_graph = kwargs["route_graph"]
+            if kwargs.get("peer"):
+                message["SyncType"], message["MessageBody"] = route_graph.make_sync_body(kwargs["peer"])
+            else:
+                message["MessageBody"] = route_graph.to_json()
+            message["Epoch"] = route_graph.epoch
+            message["Sequence"] = route_graph.version
         elif sync_type == "add_single_edge":
             pass
         elif sync_type == "remove_single_edge":
             pass
         elif sync_type == "update_node_data":
-            message["MessageBody"] = kwargs["node"]
+            # copy the node views of topology to plain dicts
+            node = kwargs["node"]
+            message["MessageBody"] = [dict(n) for n in node] if isinstance(node, list) else dict(node)
         return message
     ###### message for node end ########
 
     @staticmethod
-    def make_ack_router_info_msg(router):
+    def make_ack_router_info_msg(router, routers=None):
+        """
+        :param router: the best router\n
+        :param routers: the alternative routers ranked by fee(include the best one)
+        """
         message = {
             "MessageType": "AckRouterInfo",
             "RouterInfo": router
         }
+        if routers is not None:
+            message["RouterList"] = routers
         return message
 
     @staticmethod
@@ -259,4 +309,30 @@ class MessageMake:
             "MessageType": msg_type,
             "Reason": kwargs.get("reason")
         }
-        return message
\ No newline at end of file
+        return message
+
+
+class MessageIdSet:
+    """
+    the bounded LRU set of the broadcast message ids that have been handled
+    """
+    def __init__(self, max_size=cg_seen_message_size):
+        self.max_size = max_size
+        self.message_ids = OrderedDict()
+        self.drop_times = 0
+
+    def check_and_add(self, message_id):
+        """
+        :param message_id: the MessageId of the message\n
+        :return: True if the message has been seen
+        """
+        if not message_id:
+            return False
+        if message_id in self.message_ids:
+            self.message_ids.move_to_end(message_id)
+            self.drop_times += 1
+            return True
+        self.message_ids[message_id] = None
+        while len(self.message_ids) > self.max_size:
+            self.message_ids.popitem(last=False)
+        return False
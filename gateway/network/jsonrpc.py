@@ -1,10 +1,12 @@
 # coding: utf-8
 import asyncio
-from aiohttp import web, ClientSession
+from aiohttp import web, ClientSession, TCPConnector
 from jsonrpcserver.aio import methods
 from jsonrpcclient.aiohttp_client import aiohttpClient
 from jsonrpcclient.http_client import HTTPClient
 from glog import rpc_logger
+from config import cg_jsonrpc_pool_size, cg_jsonrpc_pool_size_per_host, cg_jsonrpc_keepalive,\
+ cg_jsonrpc_timeout
 
 @methods.add
 async def ShowNodeList(params):
@@ -44,7 +46,7 @@ async def TransactionMessage(params):
 @methods.add
 async def GetRouterInfo(params):
     from gateway import gateway_singleton
-    return gateway_singleton.handle_wallet_request('GetRouterInfo', params)
+    return await gateway_singleton.handle_wallet_router_request(params)
 
 @methods.add
 async def CloseWallet(params):
@@ -52,6 +54,36 @@ async def CloseWallet(params):
     return gateway_singleton.handle_wallet_request("CloseWallet", params)
     
 class AsyncJsonRpc():
+    # the client session shared by the requests to the wallets, keep the connections alive
+    session = None
+
+    @classmethod
+    def get_session(cls):
+        if cls.session is None or cls.session.closed:
+            connector = TCPConnector(
+                limit=cg_jsonrpc_pool_size,
+                limit_per_host=cg_jsonrpc_pool_size_per_host,
+                keepalive_timeout=cg_jsonrpc_keepalive
+            )
+            cls.session = ClientSession(connector=connector)
+        return cls.session
+
+    @classmethod
+    async def close_session(cls):
+        if cls.session is not None and not cls.session.closed:
+            await cls.session.close()
+        cls.session = None
+
+    @classmethod
+    async def request_coro(cls, method, params, addr):
+        """
+        send the request with the pooled session\n
+        raise asyncio.TimeoutError after cg_jsonrpc_timeout seconds
+        """
+        endpoint = 'http://' + addr[0] + ":" + str(addr[1])
+        client = aiohttpClient(cls.get_session(), endpoint)
+        return await asyncio.wait_for(client.request(method, params), cg_jsonrpc_timeout)
+
     @staticmethod
     async def handle(request):
         request = await request.text()
@@ -75,15 +107,22 @@ class AsyncJsonRpc():
         return server
         # web.run_app(app, host=cg_local_jsonrpc_addr[0], port=cg_local_jsonrpc_addr[1])
         
-    @staticmethod
-    async def jsonrpc_request(method, params, addr):
-        async with ClientSession() as session:
-            endpoint = 'http://' + addr[0] + ":" + str(addr[1])
-            client = aiohttpClient(session, endpoint)
-            rpc_logger.info("--> send msg to wallet_cli{}".format(addr))
-            response = await client.request(method, params)
-            from gateway import gateway_singleton
-            gateway_singleton.handle_wallet_response(method, response)
+    @classmethod
+    async def jsonrpc_request(cls, method, params, addr):
+        rpc_logger.info("--> send msg to wallet_cli{}".format(addr))
+        response = await cls.request_coro(method, params, addr)
+        from gateway import gateway_singleton
+        gateway_singleton.handle_wallet_response(method, response)
+
+    @classmethod
+    async def jsonrpc_request_coro(cls, method, params, addr):
+        """
+        :return: the response of the remote server
+        """
+        rpc_logger.info("--> sender to {}\n : {}".format(addr,params))
+        response = await cls.request_coro(method, params, addr)
+        rpc_logger.info("<-- receiver from {}\n : {}".format(addr,response))
+        return response
 
     @staticmethod
     def jsonrpc_request_sync(method, params, addr):
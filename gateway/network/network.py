@@ -4,14 +4,15 @@ the module gather all protocols for trinity network communication
 """
 import asyncio
 import uvloop
-import json
+import codec
 from .tcp import TcpService
 from .jsonrpc import AsyncJsonRpc
 from .wsocket import WsocketService
 from config import cg_tcp_addr, cg_wsocket_addr, cg_public_ip_port, cg_local_jsonrpc_addr,\
 cg_remote_jsonrpc_addr, cg_reused_tcp_connection
 from asyncio import ensure_future
-from utils import encode_bytes
+from utils import encode_bytes, decode_bytes
+from message import Message
 from glog import tcp_logger, wst_logger
 import time
 
@@ -44,6 +45,7 @@ class Network:
         cls.ws_server.close()
         cls.tcp_manager.server.close()
         cls.rpc_server.close()
+        cls.loop.run_until_complete(AsyncJsonRpc.close_session())
         tasks = asyncio.gather(*asyncio.Task.all_tasks(), loop=cls.loop, return_exceptions=True)
         tasks.add_done_callback(lambda t: cls.loop.stop())
         tasks.cancel()
@@ -56,9 +58,8 @@ class Network:
         :param message: dict type \n
         :param interval: default 15s
         """
-        data = json.dumps(data)
-        future = ensure_future(WsocketService.push_by_event(cls.ws_server.websockets, data))
-        future.add_done_callback(lambda t: t.exception())
+        data = codec.dumps_text(data)
+        WsocketService.push_by_event(cls.ws_server.websockets, data)
 
     @classmethod
     def add_timer_push_web_task(cls, data, interval=15):
@@ -66,7 +67,7 @@ class Network:
         :param message: dict type \n
         :param interval: default 15s
         """
-        data = json.dumps(data)
+        data = codec.dumps_text(data)
         future = ensure_future(WsocketService.push_by_timer(cls.ws_server.websockets, interval, data))
         future.add_done_callback(lambda t: t.exception())
 
@@ -75,17 +76,42 @@ class Network:
     def send_msg_with_tcp(receiver, data):
         """
         :param receiver: str type: xxxx@ip:port \n
-        :param data: dict type
+        :param data: dict type\n
+        :return: False if the message was dropped or refused by the slow peer
         """
         # time.sleep(0.05)
-        bdata = encode_bytes(data)
+        # the node data sync messages can be dropped for the slow peer, never the tx
+        # messages, nor the graph sync messages which move the log position of the peer
+        droppable = isinstance(data, dict) and data.get("MessageType") == "SyncChannelState" and \
+            data.get("SyncType") not in Message.get_graph_sync_types()
         connection = TcpService.find_connection(receiver)
         if connection and cg_reused_tcp_connection:
             tcp_logger.info("find the exist connection")
-            connection.write(bdata)
+            # the relay gateways route the transaction messages by the envelope
+            envelope = "envelope" in connection.peer_codecs and isinstance(data, dict) and \
+                data.get("MessageType") in Message.get_tx_msg_types()
+            return connection.send(encode_bytes(data, connection.codec, envelope), droppable)
         else:
-            future = asyncio.ensure_future(TcpService.send_tcp_msg_coro(receiver, bdata))
-            future.add_done_callback(lambda t: t.exception())
+            return TcpService.send_tcp_msg(receiver, encode_bytes(data), droppable)
+
+    @staticmethod
+    def forward_frame_with_tcp(receiver, version, bdata):
+        """
+        forward the received frame without decoding if the next peer can read it\n
+        :param receiver: str type: xxxx@ip:port \n
+        :param version: the version field of the frame header\n
+        :param bdata: the frame body, bytes type\n
+        :return: False if the frame was refused by the slow peer
+        """
+        connection = TcpService.find_connection(receiver)
+        if connection and cg_reused_tcp_connection and codec.can_read(version, connection.peer_codecs):
+            # the header and body are queued in one send, the peer never gets the header alone
+            if not connection.send(codec.make_header(version, len(bdata)) + bdata):
+                tcp_logger.warning("the %d bytes frame to %s is not forwarded", len(bdata), receiver)
+                return False
+            return True
+        else:
+            return Network.send_msg_with_tcp(receiver, decode_bytes(bdata, version=version))
     
     @staticmethod
     def send_msg_with_wsocket(connection, data):
@@ -94,9 +120,9 @@ class Network:
         :param data: dict type
         """
         if connection:
-            data = json.dumps(data)
-            future = asyncio.ensure_future(WsocketService.send_msg(connection, data))
-            future.add_done_callback(lambda t: t.exception())
+            if not isinstance(data, str):
+                data = codec.dumps_text(data)
+            WsocketService.send_msg(connection, data)
         else:
             wst_logger.info("the spv is disconnected")
 
@@ -108,7 +134,8 @@ class Network:
         :param data: dict type\n
         :param data: asyncio event loop
         """
-        data = json.dumps(data)
+        if not isinstance(data, str):
+            data = codec.dumps_text(data)
         future = asyncio.ensure_future(
             AsyncJsonRpc.jsonrpc_request(method, data, addr)
         )
@@ -119,8 +146,16 @@ class Network:
         else:
             future.add_done_callback(lambda t: t.exception())
 
+    @staticmethod
+    def send_msg_with_jsonrpc_coro(method, addr, data):
+        """
+        :return: the coroutine which result is the response of the remote server
+        """
+        data = codec.dumps_text(data)
+        return AsyncJsonRpc.jsonrpc_request_coro(method, data, addr)
+
     @staticmethod
     def send_msg_with_jsonrpc_sync(method, addr, data):
-        data = json.dumps(data)
+        data = codec.dumps_text(data)
         return AsyncJsonRpc.send_msg_with_jsonrpc_sync(method, addr, data)
   
\ No newline at end of file
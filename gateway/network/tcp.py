@@ -1,9 +1,13 @@
 # coding: utf-8
-from asyncio import Protocol, get_event_loop
-from config import cg_end_mark, cg_bytes_encoding, cg_tcp_addr, cg_debug_multi_ports
+from asyncio import Protocol, get_event_loop, sleep, ensure_future
+from collections import deque
+from config import cg_end_mark, cg_bytes_encoding, cg_tcp_addr, cg_debug_multi_ports,\
+ cg_max_frame_size, cg_bad_frame_policy, cg_tcp_send_high_water, cg_tcp_slow_peer_policy,\
+ cg_tcp_dial_retries, cg_tcp_backoff_base, cg_tcp_backoff_max
 from utils import request_handle_result
 from glog import tcp_logger
-import struct, socket
+import socket, random
+from codec import FrameDecoder, FrameError, CODEC_JSON, COMPRESS_NONE
 # from datagram import Datagram
 
 class ProtocolManage():
@@ -29,13 +33,178 @@ class ProtocolManage():
 
 tcp_manager = ProtocolManage()
 
+# the bytes queued to one peer at most, whatever cg_tcp_slow_peer_policy, but
+# the empty queue always accepts one frame(up to cg_max_frame_size)
+max_queued_bytes = 4 * cg_tcp_send_high_water
+
+# the protocol whose received frames are being handled, it is not read until the
+# slow peers its frames are relayed to drain
+receiving_protocol = None
+
+def forget_peer(ip):
+    """
+    the graph sync frames to the peer were lost, its log position is unknown
+    """
+    from gateway import gateway_singleton
+    gateway_singleton.forget_peer(ip)
+
+class ConnectionManage():
+    """
+    the outbound connections keyed by the peer address(ip, port)\n
+    only one dial is in flight for a peer, the messages sent meanwhile are
+    queued and written once it is connected; the public keys share the
+    same ip:port share the connection
+    """
+    def __init__(self):
+        self.connections = {}
+        self.dials = {}
+        # {addr: deque of (bytes, droppable)} waiting for the connection
+        self.pending = {}
+        # {addr: set of public keys} to register in tcp_pk_dict when connected
+        self.pending_pks = {}
+        self.dial_failures = 0
+
+    def get(self, addr):
+        protocol = self.connections.get(addr)
+        if protocol and protocol.state == "connected":
+            return protocol
+        return None
+
+    def adopt(self, addr, protocol):
+        """
+        reuse the connection made by the peer for sending to it
+        """
+        if not self.get(addr):
+            self.connections[addr] = protocol
+            protocol.peer_addr = addr
+            self._flush_pending(addr, protocol)
+
+    def send(self, url, bdata, droppable=False):
+        from gateway import gateway_singleton
+        from utils import get_addr, get_public_key
+        addr = get_addr(url)
+        pk = get_public_key(url)
+        protocol = self.get(addr)
+        if protocol:
+            gateway_singleton.tcp_pk_dict[pk] = protocol
+            return protocol.send(bdata, droppable)
+        queue = self.pending.setdefault(addr, deque())
+        queued_bytes = sum(len(frame) for frame, _ in queue)
+        if droppable and queued_bytes + len(bdata) > cg_tcp_send_high_water:
+            tcp_logger.warning("drop the %d bytes sync frame to the unconnected peer %s", len(bdata), addr)
+            return False
+        if queue and queued_bytes + len(bdata) > max_queued_bytes:
+            tcp_logger.error("refuse the %d bytes frame to the unconnected peer %s", len(bdata), addr)
+            forget_peer(addr[0])
+            return False
+        queue.append((bdata, droppable))
+        self.pending_pks.setdefault(addr, set()).add(pk)
+        self.dial(addr)
+        return True
+
+    def dial(self, addr):
+        """
+        :return: the in-flight dial future of the addr
+        """
+        future = self.dials.get(addr)
+        if not future:
+            from asyncio import ensure_future
+            future = ensure_future(self._dial_coro(addr))
+            future.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self.dials[addr] = future
+        return future
+
+    @staticmethod
+    def backoff_delay(attempt):
+        """
+        the exponential delay with full jitter, the peers lost at the same time
+        don't dial again all at once
+        """
+        return random.uniform(0, min(cg_tcp_backoff_max, cg_tcp_backoff_base * 2 ** attempt))
+
+    async def _dial_coro(self, addr):
+        try:
+            for attempt in range(cg_tcp_dial_retries):
+                if attempt:
+                    await sleep(self.backoff_delay(attempt))
+                protocol = self.get(addr)
+                if protocol:
+                    break
+                try:
+                    _, protocol = await get_event_loop().create_connection(TProtocol, addr[0], addr[1])
+                except OSError as ex:
+                    self.dial_failures += 1
+                    tcp_logger.warning("dial %s failed(%d/%d): %s", addr, attempt + 1, cg_tcp_dial_retries, ex)
+                    continue
+                protocol.peer_addr = addr
+                self.connections[addr] = protocol
+                self._negotiate_codec(protocol)
+                break
+            else:
+                dropped = self.pending.pop(addr, ())
+                self.pending_pks.pop(addr, None)
+                tcp_logger.error("give up dialing %s, %d messages dropped", addr, len(dropped))
+                if dropped:
+                    forget_peer(addr[0])
+                return None
+            self._flush_pending(addr, protocol)
+            return protocol
+        finally:
+            self.dials.pop(addr, None)
+
+    @staticmethod
+    def _negotiate_codec(protocol):
+        """
+        tell the peer the codecs can read, the old gateways ignore the message
+        """
+        from message import MessageMake
+        from utils import encode_bytes, get_wire_codecs
+        protocol.send(encode_bytes(MessageMake.make_negotiate_codec_msg(get_wire_codecs())))
+
+    def _flush_pending(self, addr, protocol):
+        from gateway import gateway_singleton
+        for pk in self.pending_pks.pop(addr, ()):
+            gateway_singleton.tcp_pk_dict[pk] = protocol
+        for bdata, droppable in self.pending.pop(addr, ()):
+            protocol.send(bdata, droppable)
+
+    def lost(self, protocol):
+        """
+        the tx frames not written yet are sent again with a new connection
+        """
+        addr = protocol.peer_addr
+        if addr is None or self.connections.get(addr) is not protocol:
+            return
+        del self.connections[addr]
+        frames = [(bdata, droppable) for bdata, droppable in protocol.send_queue if not droppable]
+        if frames:
+            self.pending.setdefault(addr, deque()).extendleft(reversed(frames))
+            self.dial(addr)
+
+tcp_connector = ConnectionManage()
+
 class TProtocol(Protocol):
     """
     Each client connection will create a new protocol instance
     """
     def __init__(self):
         super().__init__()
-        self.received = bytes()
+        self.decoder = FrameDecoder(cg_max_frame_size)
+        # the (codec, compression) of the frames sent to the peer, json until negotiated
+        self.codec = (CODEC_JSON, COMPRESS_NONE)
+        # the codec names the peer can read
+        self.peer_codecs = set()
+        # the outbound frames: (bytes, droppable), flushed with one writelines per loop tick
+        self.send_queue = deque()
+        self.queued_bytes = 0
+        self.flush_scheduled = False
+        self.paused = False
+        # the futures waiting for the queue drains under the high water
+        self.drain_waiters = []
+        # the slow protocols this one is not read for
+        self.throttled_by = set()
+        # the address of the peer server if it is used to send to the peer
+        self.peer_addr = None
         self.rev_totals = 0
         self.send_totals = 0
         self.header_size = 12
@@ -72,33 +241,132 @@ class TProtocol(Protocol):
         tcp_manager.register(self)
 
     def data_received(self, data):
-        # tcp_logger.info("receive %d bytes message from %s", body_size, self.get_peername())
-        self.received = self.received + data
-        # print(len(self.received))
-        # print(self.received)
+        global receiving_protocol
+        from gateway import gateway_singleton
+        self.rev_totals += len(data)
+        self.decoder.feed(data)
         while True:
-            # print(len(self.received), self.header_size)
-            if len(self.received) < self.header_size:
-                return
-            header_pack = struct.unpack("!3I", self.received[:self.header_size])
-            # print("header_pack:", header_pack)
-            body_size = header_pack[1]
-            if header_pack[0] + header_pack[2] != 102:
+            try:
+                receiving_protocol = self
+                for version, body in self.decoder.frames():
+                    tcp_logger.info("receive %d bytes message from %s", len(body), self.get_peername())
+                    tcp_logger.debug(">>>> %s <<<<", body)
+                    result = gateway_singleton.handle_node_request(self, body, version)
                 return
-            # print(body_size)
-            # package split situation
-            if len(self.received) < self.header_size + body_size:
-                return
-            body = self.received[self.header_size:self.header_size+body_size]
-            tcp_logger.info("receive %d bytes message from %s", body_size, self.get_peername())
-            tcp_logger.debug(">>>> %s <<<<", body)
-            from gateway import gateway_singleton
-            result = gateway_singleton.handle_node_request(self, body)
-            # package splicing or clan the data_buffer:self.received
-            self.received = self.received[self.header_size+body_size:]
-            # print(self.received)
-            
-            
+            except FrameError as ex:
+                tcp_manager.rev_invalid_times += 1
+                if cg_bad_frame_policy != "resync":
+                    tcp_logger.error("close the connection %s: %s", self.get_peername(), ex)
+                    self.transport.close()
+                    return
+                skipped = self.decoder.resync()
+                tcp_logger.error("skip %d bytes from %s: %s", skipped, self.get_peername(), ex)
+            finally:
+                receiving_protocol = None
+
+    def send(self, bdata, droppable=False):
+        """
+        queue the frame, all the queued frames are written in one writelines
+        at the next loop tick\n
+        the frames are refused above max_queued_bytes unless the queue is empty,
+        so the large whole graph still goes out, the producers should check
+        writable() or await drain() before sending, the peer whose frames are
+        being relayed is not read until this drains\n
+        :param droppable: the frame(node data sync) can be dropped when the peer is slow\n
+        :return: False if the frame was dropped
+        """
+        if self.state not in ["connected", "resumed", "paused"]:
+            if not droppable:
+                forget_peer(self.peer_addr[0] if self.peer_addr else self.get_peername()[0])
+            return False
+        if self.queued_bytes + len(bdata) > cg_tcp_send_high_water:
+            self._shed_load()
+            if droppable and self.queued_bytes + len(bdata) > cg_tcp_send_high_water:
+                tcp_logger.warning("drop the %d bytes sync frame to the slow peer %s", len(bdata), self.get_peername())
+                return False
+        if self.send_queue and self.queued_bytes + len(bdata) > max_queued_bytes:
+            if cg_tcp_slow_peer_policy == "close":
+                tcp_logger.error("close the slow peer %s with %d bytes queued", self.get_peername(), self.queued_bytes)
+                self.transport.close()
+            else:
+                tcp_logger.error("refuse the %d bytes frame to the slow peer %s", len(bdata), self.get_peername())
+                forget_peer(self.peer_addr[0] if self.peer_addr else self.get_peername()[0])
+            return False
+        self.send_queue.append((bdata, droppable))
+        self.queued_bytes += len(bdata)
+        if not self.writable() and receiving_protocol and receiving_protocol is not self:
+            receiving_protocol.throttle(self)
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            get_event_loop().call_soon(self._flush)
+        return True
+
+    def writable(self):
+        """
+        :return: the queued bytes are under the high water and the transport accepts more
+        """
+        return not self.paused and self.queued_bytes <= cg_tcp_send_high_water
+
+    async def drain(self):
+        """
+        wait until writable() or the connection is lost
+        """
+        if self.writable() or self.state not in ["connected", "resumed", "paused"]:
+            return
+        waiter = get_event_loop().create_future()
+        self.drain_waiters.append(waiter)
+        await waiter
+
+    def _wake_drain_waiters(self):
+        waiters, self.drain_waiters = self.drain_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def throttle(self, protocol):
+        """
+        stop reading from this peer until the slow protocol drains
+        """
+        if protocol in self.throttled_by or self.transport.is_closing():
+            return
+        if not self.throttled_by:
+            self.transport.pause_reading()
+        self.throttled_by.add(protocol)
+        tcp_logger.info("stop reading from %s until %s drains", self.get_peername(), protocol.get_peername())
+
+        def resume(_):
+            self.throttled_by.discard(protocol)
+            if not self.throttled_by and not self.transport.is_closing():
+                self.transport.resume_reading()
+        ensure_future(protocol.drain()).add_done_callback(resume)
+
+    def _shed_load(self):
+        """
+        drop the queued node data sync frames, the oldest first
+        """
+        if not any(droppable for _, droppable in self.send_queue):
+            return
+        kept = deque()
+        for bdata, droppable in self.send_queue:
+            if droppable and self.queued_bytes > cg_tcp_send_high_water // 2:
+                self.queued_bytes -= len(bdata)
+                continue
+            kept.append((bdata, droppable))
+        self.send_queue = kept
+
+    def _flush(self):
+        self.flush_scheduled = False
+        if self.transport.is_closing():
+            return
+        # wait for resume_writing while the transport buffer is full
+        if not self.paused and self.send_queue:
+            frames = [bdata for bdata, _ in self.send_queue]
+            self.send_queue.clear()
+            self.queued_bytes = 0
+            self.transport.writelines(frames)
+            self.send_totals += sum(len(bdata) for bdata in frames)
+        if self.writable():
+            self._wake_drain_waiters()
 
     def connection_lost(self, exc):
         peername = self.transport.get_extra_info('peername')
@@ -117,18 +385,21 @@ class TProtocol(Protocol):
         if self in list(gateway_singleton.tcp_pk_dict.values()):
             gateway_singleton.handle_node_off(peername)
         tcp_manager.unregister(self)
+        tcp_connector.lost(self)
+        self._wake_drain_waiters()
         self.transport.close()
         del_dict_item_by_value(gateway_singleton.tcp_pk_dict, self)
         del self
 
 
     def pause_writing(self):
-        print(self.transport.get_write_buffer_size())
-        self.state = "paused"
+        tcp_logger.info("pause writing to %s with %d bytes buffered", self.get_peername(), self.transport.get_write_buffer_size())
+        self.paused = True
 
     def resume_writing(self):
-        print(self.transport.get_write_buffer_size())
-        self.state = "resumed"
+        tcp_logger.info("resume writing to %s", self.get_peername())
+        self.paused = False
+        self._flush()
 
     def get_peername(self):
         return self.transport.get_extra_info("peername")
@@ -145,31 +416,22 @@ class TcpService:
         or create a new connection
         """
         from gateway import gateway_singleton
-        from utils import get_public_key
+        from utils import get_public_key, get_addr
         pk = get_public_key(url)
         exist_protocol = gateway_singleton.tcp_pk_dict.get(pk)
         if exist_protocol and exist_protocol.state == "connected":
-            return exist_protocol.transport
-        # disconnected
-        else:
-            return None
+            return exist_protocol
+        # the other public key of the same ip:port is connected
+        return tcp_connector.get(get_addr(url))
 
     @staticmethod
-    async def send_tcp_msg_coro(url, bdata):
+    def send_tcp_msg(url, bdata, droppable=False):
         """
+        send with the connection of the peer address, dial it if not connected\n
         :param bdata: bytes type
         """
-        from gateway import gateway_singleton
-        from utils import get_addr, get_public_key
-        addr = get_addr(url)
-        pk = get_public_key(url)
-        result = await get_event_loop().create_connection(TProtocol, addr[0], addr[1])
-        gateway_singleton.tcp_pk_dict[pk] = result[1]
-        result[0].write(bdata)
-        result[1].send_totals += len(bdata)
-        import pprint
-        pprint.pprint(gateway_singleton.tcp_pk_dict)
-        
+        return tcp_connector.send(url, bdata, droppable)
+
     @staticmethod
     async def create_server_coro(addr):
         """
@@ -1,32 +1,108 @@
 # coding: utf-8
 import websockets
-from asyncio import sleep,CancelledError
+from collections import deque
+from asyncio import sleep, CancelledError, Event, ensure_future
 from glog import wst_logger
+from config import cg_ws_send_queue_size, cg_ws_slow_client_policy
+
+class SendQueue:
+    """
+    the bounded outgoing messages of one websocket, sent in order by its own
+    task so the slow client doesn't delay the others\n
+    when it is full the oldest message is dropped, or the client is
+    disconnected by cg_ws_slow_client_policy
+    """
+    def __init__(self, con, maxsize=cg_ws_send_queue_size, policy=cg_ws_slow_client_policy):
+        self.con = con
+        self.maxsize = maxsize
+        self.policy = policy
+        self.messages = deque()
+        self.ready = Event()
+        self.dropped = 0
+        self.closed = False
+        self.task = ensure_future(self._drain())
+
+    def put(self, msg):
+        """
+        :return: False if the message is not queued
+        """
+        if self.closed:
+            return False
+        if len(self.messages) >= self.maxsize:
+            if self.policy == "disconnect":
+                wst_logger.warning("disconnect the slow client %s", self.con.remote_address)
+                self.close()
+                ensure_future(self.con.close())
+                return False
+            self.messages.popleft()
+            self.dropped += 1
+        self.messages.append(msg)
+        self.ready.set()
+        return True
+
+    async def _drain(self):
+        """
+        the message can't be sent is logged and skipped, when the task ends
+        otherwise the queue is removed and the client is disconnected
+        """
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                while self.messages:
+                    msg = self.messages.popleft()
+                    try:
+                        await self.con.send(msg)
+                    except (websockets.exceptions.ConnectionClosed, CancelledError):
+                        raise
+                    except Exception as ex:
+                        wst_logger.error("send to %s failed: %s, message: %s", self.con.remote_address, ex, msg)
+        except (websockets.exceptions.ConnectionClosed, CancelledError):
+            pass
+        except Exception:
+            wst_logger.exception("the send queue of %s stopped", self.con.remote_address)
+            ensure_future(self.con.close())
+        finally:
+            self.closed = True
+            self.messages.clear()
+            if WsocketService.send_queues.get(self.con) is self:
+                del WsocketService.send_queues[self.con]
+
+    def close(self):
+        self.closed = True
+        self.messages.clear()
+        self.task.cancel()
+
 class WsocketService:
     """
     websocket server
     not need instance
     """
-    @staticmethod
-    async def push_by_event(cons, msg):
+    # {websocket: SendQueue}
+    send_queues = {}
+
+    @classmethod
+    def enqueue(cls, con, msg):
+        queue = cls.send_queues.get(con)
+        if queue is None:
+            if not con.open:
+                return False
+            queue = cls.send_queues[con] = SendQueue(con)
+        return queue.put(msg)
+
+    @classmethod
+    def push_by_event(cls, cons, msg):
         """
         push spv triggered by some event
         """
-        for con in cons:
-            try:
-                await con.send(msg)
-            except Exception:
-                pass
+        for con in list(cons):
+            cls.enqueue(con, msg)
     
-    @staticmethod 
-    async def push_by_timer(cons, second, msg):
+    @classmethod
+    async def push_by_timer(cls, cons, second, msg):
         while True:
             await sleep(second)
-            for con in cons:
-                try:
-                    await con.send(msg)
-                except Exception:
-                    pass
+            cls.push_by_event(cons, msg)
             
 
     @staticmethod
@@ -45,6 +121,9 @@ class WsocketService:
             except websockets.exceptions.ConnectionClosed as ex:
                 wst_logger.info('client {} disconnected'.format(con.remote_address))
                 gateway_singleton.handle_spv_lost_connection(con)
+                queue = WsocketService.send_queues.pop(con, None)
+                if queue:
+                    queue.close()
                 # task done or cancelled
                 break
             # except Exception:
@@ -55,12 +134,12 @@ class WsocketService:
                 except Exception:
                     pass
 
-    @staticmethod
-    async def send_msg(con, msg):
-        try:
-            await con.send(msg)
-        except Exception:
-            pass
+    @classmethod
+    def send_msg(cls, con, msg):
+        """
+        queue the msg after the pushed ones of the connection
+        """
+        return cls.enqueue(con, msg)
 
     @staticmethod
     async def create_server_coro(addr):
@@ -0,0 +1,131 @@
+# coding: utf-8
+"""
+the node registry shared by the per-asset topologies\n
+the wallet attributes that don't depend on the asset(Name, Ip, WalletIp,
+Status, Balance) are saved once per public key and network magic, the
+topology of every asset only keeps its own attributes(Fee, AssetType) and
+edges, the same key of other magic is the other wallet\n
+TopoNode is the dict-like view of the both parts, what get_node_dict returns
+"""
+import weakref
+from collections.abc import MutableMapping
+
+SHARED_ATTRS = ("Name", "Ip", "WalletIp", "Status", "Balance")
+
+
+class NodeRegistry(object):
+    """
+    nodes: {(magic, public_key): shared attributes}\n
+    topos: {public_key: WeakSet of the Nettopo include the node}\n
+    ips: {ip: set of (magic, public_key)} the nodes attached the gateway of ip
+    """
+    def __init__(self):
+        self.nodes = {}
+        self.topos = {}
+        self.ips = {}
+
+    def get(self, pk, magic=None):
+        """
+        :return: dict of the shared attributes or None
+        """
+        return self.nodes.get((magic, pk))
+
+    def get_shared(self, pk, magic=None):
+        return self.nodes.setdefault((magic, pk), {})
+
+    def attach(self, pk, topo):
+        self.topos.setdefault(pk, weakref.WeakSet()).add(topo)
+
+    def set_ip(self, pk, ip_port, magic=None):
+        """
+        set the Ip attribute and keep the ip index
+        """
+        shared = self.get_shared(pk, magic)
+        old_ip_port = shared.get("Ip")
+        if old_ip_port:
+            keys = self.ips.get(old_ip_port.split(":")[0])
+            if keys:
+                keys.discard((magic, pk))
+                if not keys:
+                    del self.ips[old_ip_port.split(":")[0]]
+        if ip_port is None:
+            shared.pop("Ip", None)
+        else:
+            shared["Ip"] = ip_port
+            self.ips.setdefault(ip_port.split(":")[0], set()).add((magic, pk))
+
+    def find_by_ip(self, ip):
+        """
+        :return: list of the (magic, public key) attached the gateway of ip
+        """
+        return list(self.ips.get(ip, ()))
+
+    def get_topos(self, pk, magic=None):
+        """
+        :param magic: only the Nettopo of the magic if provided\n
+        :return: list of the Nettopo include the node
+        """
+        topos = self.topos.get(pk, ())
+        if magic is not None:
+            return [topo for topo in topos if topo.magic == magic]
+        return list(topos)
+
+node_registry = NodeRegistry()
+
+
+class TopoNode(MutableMapping):
+    """
+    the node attributes of one topology, the shared ones are read and written
+    through the node registry
+    """
+    __slots__ = ("pk", "magic", "shared", "local")
+
+    def __init__(self, pk, magic=None):
+        self.pk = pk
+        self.magic = magic
+        self.shared = node_registry.get_shared(pk, magic)
+        self.local = {}
+
+    def __getitem__(self, key):
+        if key == "Publickey":
+            return self.pk
+        if key in SHARED_ATTRS:
+            return self.shared[key]
+        return self.local[key]
+
+    def __setitem__(self, key, value):
+        if key == "Publickey":
+            if value != self.pk:
+                raise ValueError("the Publickey of node can't be changed")
+        elif key == "Ip":
+            node_registry.set_ip(self.pk, value, self.magic)
+        elif key in SHARED_ATTRS:
+            self.shared[key] = value
+        else:
+            self.local[key] = value
+
+    def __delitem__(self, key):
+        if key == "Publickey":
+            raise KeyError(key)
+        if key == "Ip":
+            if key not in self.shared:
+                raise KeyError(key)
+            node_registry.set_ip(self.pk, None, self.magic)
+        elif key in SHARED_ATTRS:
+            del self.shared[key]
+        else:
+            del self.local[key]
+
+    def __iter__(self):
+        yield "Publickey"
+        for key in SHARED_ATTRS:
+            if key in self.shared:
+                yield key
+        for key in self.local:
+            yield key
+
+    def __len__(self):
+        return 1 + sum(1 for key in SHARED_ATTRS if key in self.shared) + len(self.local)
+
+    def __repr__(self):
+        return repr(dict(self))
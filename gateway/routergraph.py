@@ -137,9 +137,8 @@ class RouterGraph():
         nid = data["Nid"]
         old_fee = node["Fee"]
         diff = data["Fee"] - old_fee
-        for edge in self._graph.edges:
-            if nid in edge:
-                self._graph.edges[edge[0],edge[1]]["weight"] += diff
+        for edge in self._graph.adj[nid].values():
+            edge["weight"] += diff
                 
     @timethis
     def find_shortest_path_decide_by_fee(self, source, target):
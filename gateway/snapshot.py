@@ -0,0 +1,257 @@
+# coding: utf-8
+"""
+the snapshot file of the gateway topologies, saved periodically and on
+shutdown, loaded on start so the gateway need not rebuild the graphs from
+the whole graph exchanges\n
+file layout:\n
+    magic(8 bytes) | index length(!I) | index json | sections\n
+index = {
+    "ByteOrder": "little|big",
+    "SpvTable": [offset, length],
+    "Topos": {network_trait: {"Meta": [offset, length], "Edges": [offset, count]}}
+}\n
+the Meta section is the zlib compressed json of the topology attributes and
+the nodes; the Edges section is the raw uint32 array of
+(u, v) indexes into the Meta "Keys", read without copy from the mmap\n
+every section is read only when its topology is loaded\n
+the gateway takes the uncompressed sections on the loop by make_sections and
+compresses and writes them by write_snapshot in snapshot_executor
+"""
+import os
+import sys
+import json
+import mmap
+import zlib
+import struct
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from topo import Nettopo, NetNeighborAttributes
+from noderegistry import node_registry
+from config import cg_public_ip_port
+
+SNAPSHOT_MAGIC = b"TNSNAP01"
+
+# one worker so the snapshots are written in order
+snapshot_executor = ThreadPoolExecutor(max_workers=1)
+
+
+def _make_topo_meta(topo):
+    """
+    :return: (meta dict, edges array)
+    """
+    data = topo.to_json()
+    keys = []
+    nodes = []
+    ids = {}
+    for node in data["nodes"]:
+        node = dict(node)
+        pk = node.pop("id")
+        ids[pk] = len(keys)
+        keys.append(pk)
+        nodes.append(node)
+    edges = array("I")
+    edge_names = []
+    for link in data.get("links", data.get("edges", [])):
+        edges.append(ids[link["source"]])
+        edges.append(ids[link["target"]])
+        edge_names.append(link.get("name"))
+    neighbors = {}
+    for net_id, neighbor_attrs in topo.neighbors_hash.neighbors_hash.items():
+        neighbors[net_id] = {ip: attr.links for ip, attr in neighbor_attrs.items()}
+    meta = {
+        "Magic": topo.magic,
+        "NetworkTrait": topo.network_trait,
+        "Version": topo.version,
+        "ReceivedSequences": topo.received_sequences,
+        "Neighbors": neighbors,
+        "Keys": keys,
+        "Nodes": nodes,
+        "EdgeNames": edge_names
+    }
+    return meta, edges
+
+
+def make_sections(topos):
+    """
+    take the bytes of the topologies, the Meta and SpvTable sections are
+    compressed later by write_snapshot\n
+    :param topos: {network_trait: Nettopo}\n
+    :return: list of (network_trait, section name, bytes)
+    """
+    sections = []
+    spv_table = None
+    for network_trait, topo in topos.items():
+        meta, edges = _make_topo_meta(topo)
+        sections.append((network_trait, "Meta", json.dumps(meta, separators=(",", ":")).encode()))
+        sections.append((network_trait, "Edges", edges.tobytes()))
+        spv_table = topo.spv_table
+    if spv_table is not None:
+        sections.append((None, "SpvTable", spv_table.to_json().encode()))
+    return sections
+
+
+def write_snapshot(path, sections):
+    """
+    compress the sections and write the snapshot to a temporary file then
+    replace the old one, touches no topology so it can run in the executor\n
+    :param sections: the result of make_sections
+    """
+    sections = [
+        (network_trait, name, zlib.compress(section) if name in ("Meta", "SpvTable") else section)
+        for network_trait, name, section in sections
+    ]
+    index = {"ByteOrder": sys.byteorder, "Topos": {}}
+    # the offsets depend on the index length, lay out until it is stable
+    index_bytes = b""
+    while True:
+        offset = len(SNAPSHOT_MAGIC) + 4 + len(index_bytes)
+        for network_trait, name, section in sections:
+            # align the sections for the uint32 view
+            offset += -offset % 4
+            if name == "SpvTable":
+                index[name] = [offset, len(section)]
+            elif name == "Edges":
+                index["Topos"][network_trait][name] = [offset, len(section) // 4]
+            else:
+                index["Topos"][network_trait] = {name: [offset, len(section)]}
+            offset += len(section)
+        new_index_bytes = json.dumps(index, separators=(",", ":")).encode()
+        stable = len(new_index_bytes) == len(index_bytes)
+        index_bytes = new_index_bytes
+        if stable:
+            break
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as fs:
+        fs.write(SNAPSHOT_MAGIC)
+        fs.write(struct.pack("!I", len(index_bytes)))
+        fs.write(index_bytes)
+        for _, _, section in sections:
+            fs.write(b"\0" * (-fs.tell() % 4))
+            fs.write(section)
+    os.replace(tmp_path, path)
+
+
+def save_snapshot(path, topos):
+    """
+    :param topos: {network_trait: Nettopo}
+    """
+    write_snapshot(path, make_sections(topos))
+
+
+class Snapshot(object):
+    """
+    the read only view of the snapshot file, only the index is parsed on open\n
+    usage:\n
+        with Snapshot.open(path) as snapshot:
+            for network_trait in snapshot.network_traits():
+                topo = snapshot.load_topo(network_trait)
+    """
+    def __init__(self, fs):
+        self._fs = fs
+        self._mmap = mmap.mmap(fs.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            self.close()
+            raise ValueError("invalid snapshot file")
+        start = len(SNAPSHOT_MAGIC)
+        index_length = struct.unpack("!I", self._mmap[start:start + 4])[0]
+        self.index = json.loads(self._mmap[start + 4:start + 4 + index_length].decode())
+
+    @classmethod
+    def open(cls, path):
+        """
+        :return: Snapshot or None if the file not exists
+        """
+        if not os.path.exists(path):
+            return None
+        return cls(open(path, "rb"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._mmap.close()
+        self._fs.close()
+
+    def network_traits(self):
+        return list(self.index["Topos"].keys())
+
+    def _read_json(self, offset, length):
+        return json.loads(zlib.decompress(self._mmap[offset:offset + length]).decode())
+
+    def _edge_view(self, offset, count):
+        view = memoryview(self._mmap)[offset:offset + count * 4].cast("I")
+        if self.index["ByteOrder"] != sys.byteorder:
+            edges = array("I", view)
+            view.release()
+            edges.byteswap()
+            return edges
+        return view
+
+    def load_spv_table(self, spv_table):
+        """
+        add the snapshot spv table entries to the spv_table
+        """
+        if self.index.get("SpvTable"):
+            spv_table.sync_table(self._read_json(*self.index["SpvTable"]))
+
+    def load_topo(self, network_trait):
+        """
+        rebuild the topology without logging the mutations, the wallets attached
+        this gateway are marked off-line until they connect again, so nids is
+        left empty and filled by Nettopo.add_or_update\n
+        the snapshot maybe older than what the peers received before the crash,
+        so the topology starts a new epoch and the peers get the whole graph once,
+        the received_sequences are kept since they point into the peers' logs\n
+        :return: Nettopo of the backend selected by cg_topo_backend
+        """
+        sections = self.index["Topos"][network_trait]
+        meta = self._read_json(*sections["Meta"])
+        topo = Nettopo.create()
+        topo.magic = meta["Magic"]
+        topo.network_trait = meta["NetworkTrait"]
+        topo.version = meta["Version"]
+        topo.received_sequences = {k: tuple(v) for k, v in meta["ReceivedSequences"].items()}
+        for net_id, neighbor_attrs in meta["Neighbors"].items():
+            topo.neighbors_hash.neighbors_hash[net_id] = {}
+            for ip, links in neighbor_attrs.items():
+                attr = NetNeighborAttributes(ip, net_id)
+                attr.total_links = list(links)
+                topo.neighbors_hash.neighbors_hash[net_id][ip] = attr
+        keys = meta["Keys"]
+        graph = topo._graph
+        for pk, node in zip(keys, meta["Nodes"]):
+            if node.get("Ip") == cg_public_ip_port:
+                node["Status"] = 0
+            graph.add_node(pk, **node)
+            node_registry.attach(pk, topo)
+        nodes = graph.nodes
+        edges = self._edge_view(*sections["Edges"])
+        try:
+            for i, name in enumerate(meta["EdgeNames"]):
+                u = keys[edges[2 * i]]
+                v = keys[edges[2 * i + 1]]
+                graph.add_edge(u, v, weight=nodes[u]["Fee"] + nodes[v]["Fee"], name=name)
+        finally:
+            if isinstance(edges, memoryview):
+                edges.release()
+        return topo
+
+
+def load_snapshot(path, topos):
+    """
+    :param topos: {network_trait: Nettopo} the loaded topologies are added to it\n
+    :return: number of the loaded topologies
+    """
+    snapshot = Snapshot.open(path)
+    if not snapshot:
+        return 0
+    with snapshot:
+        network_traits = snapshot.network_traits()
+        for network_trait in network_traits:
+            topos[network_trait] = snapshot.load_topo(network_trait)
+        if network_traits:
+            snapshot.load_spv_table(topos[network_traits[0]].spv_table)
+    return len(network_traits)
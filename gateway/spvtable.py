@@ -132,11 +132,13 @@ class WalletSet(object):
 class SPVHashTable(object):
     """
     Description: use the dictionary to hash the spv table with wallet node address
+    and keep the reverse index from spv to wallets, both values are sets
     """
     hash_instance = None
 
     def __init__(self):
         self.__maps = {}
+        self.__spv_maps = {}
         pass
 
     def __new__(cls, *args, **kwargs):
@@ -149,17 +151,17 @@ class SPVHashTable(object):
     def maps(self):
         return self.__maps
 
+    @property
+    def spv_maps(self):
+        return self.__spv_maps
+
     def find_keys(self, spv_key):
         """
 
         :param spv_key: The public key string of the spv\n
         :return: list type. [wallet-1-public-key , wallet-2-public-key, ...]
         """
-        keys = []
-        for key in self.maps:
-            if spv_key in self.find(key):
-                keys.append(key)
-        return keys
+        return list(self.spv_maps.get(spv_key, ()))
 
     def find(self, key):
         """
@@ -167,7 +169,8 @@ class SPVHashTable(object):
         :param key: The public key string of the wallet\n
         :return: list type. [spv-1-public-key , spv-2-public-key, ...]
         """
-        return self.maps.get(key)
+        spv_set = self.maps.get(key)
+        return list(spv_set) if spv_set is not None else None
 
     def add(self, key, value):
         """
@@ -176,12 +179,8 @@ class SPVHashTable(object):
         :param value:   the public key of the spv
         :return:
         """
-        if key not in self.maps.keys():
-            self.maps.update({key:[value]})
-        else:
-            self.maps[key].append(value)
-        # elif value not in self.maps.get(key):
-        #     self.maps[key].append(value)
+        self.maps.setdefault(key, set()).add(value)
+        self.spv_maps.setdefault(value, set()).add(key)
 
     def remove(self, key, value):
         """
@@ -190,10 +189,13 @@ class SPVHashTable(object):
         :param value:   the public key of the spv
         :return:
         """
-        if key in self.maps.keys():
-            spv_list = self.maps[key]
-            if value in spv_list:
-                spv_list.remove(value)
+        if key in self.maps:
+            self.maps[key].discard(value)
+        wallet_set = self.spv_maps.get(value)
+        if wallet_set is not None:
+            wallet_set.discard(key)
+            if not wallet_set:
+                del self.spv_maps[value]
 
     def sync_table(self, hash_table):
         """
@@ -208,14 +210,11 @@ class SPVHashTable(object):
             return
 
         for key in hash_table:
-            if key in self.maps:
-                self.maps[key].extend(hash_table[key])
-                self.maps[key] = list(set(self.maps[key]))
-            else:
-                self.maps[key] = hash_table[key]
+            for value in hash_table[key]:
+                self.add(key, value)
 
     def to_json(self):
-        return json.dumps(self.maps)
+        return json.dumps({key: list(value) for key, value in self.maps.items()})
 
     @staticmethod
     def to_dict(s):
@@ -2,10 +2,19 @@
 from functools import wraps
 import time
 import json
+import heapq
+import copy
+import uuid
+import asyncio
+from collections import OrderedDict, deque
 import networkx as nx
 from spvtable import SPVHashTable
+from landmark import LandmarkTable
+from noderegistry import node_registry, TopoNode, SHARED_ATTRS
 from networkx.readwrite import json_graph
-from config import cg_public_ip_port
+from glog import tcp_logger
+from config import cg_public_ip_port, cg_route_cache_size, cg_route_cache_ttl, cg_topo_backend,\
+ cg_sync_log_size, cg_route_mode, cg_landmark_count, cg_landmark_refresh_delay
 import utils
 
 """
@@ -56,6 +65,19 @@ MessageBody = {
     "Balance": 5,
     "SpvList": []
 }
+
+# instead of add_whole_graph when the peer has synced the graph before
+# the graph mutations that the peer not yet seen, Epoch and Sequence of the
+# message is the sender's graph log position
+# SyncType = apply_delta
+MessageBody = {
+    "Operations": [
+        ["add_node", node_data],
+        ["update_node", node_data],
+        ["add_edge", "pk1", "pk2"],
+        ["remove_edge", "pk1", "pk2"]
+    ]
+}
 """
 def timethis(func):
     @wraps(func)
@@ -182,13 +204,103 @@ class NetNeighborHash(object):
         return self.neighbors_hash.get(net_id, {})
 
 
+class RouteCache(object):
+    """
+    LRU cache for the searched path\n
+    key: (network_trait, source, target, amount) value: (graph version, timestamp, path)\n
+    the entry is stale when the graph version changed or the ttl expired
+    """
+    def __init__(self, max_size=cg_route_cache_size, ttl=cg_route_cache_ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.routes = OrderedDict()
+        self.hit_times = 0
+        self.miss_times = 0
+
+    def get(self, key, version):
+        """
+        :param key: (network_trait, source, target)\n
+        :param version: current version of the graph\n
+        :return: the cached path or None
+        """
+        entry = self.routes.get(key)
+        if entry:
+            cached_version, timestamp, path = entry
+            if cached_version == version and time.time() - timestamp < self.ttl:
+                self.routes.move_to_end(key)
+                self.hit_times += 1
+                return path
+            del self.routes[key]
+        self.miss_times += 1
+        return None
+
+    def put(self, key, version, path):
+        self.routes[key] = (version, time.time(), path)
+        self.routes.move_to_end(key)
+        while len(self.routes) > self.max_size:
+            self.routes.popitem(last=False)
+
+    def clear(self):
+        self.routes.clear()
+
+route_cache = RouteCache()
+
+
+class TopoGraph(nx.Graph):
+    """
+    networkx graph keeps the node attributes in TopoNode
+    """
+    # the network magic the nodes' shared attributes belong to
+    magic = None
+
+    def add_node(self, node_for_adding, **attr):
+        if node_for_adding not in self._node:
+            super().add_node(node_for_adding)
+            self._node[node_for_adding] = TopoNode(node_for_adding, self.magic)
+        self._node[node_for_adding].update(attr)
+
+    def add_edge(self, u_of_edge, v_of_edge, **attr):
+        for pk in (u_of_edge, v_of_edge):
+            if pk not in self._node:
+                self.add_node(pk)
+        super().add_edge(u_of_edge, v_of_edge, **attr)
+
+
 class Nettopo:
     def __init__(self):
         # save wallet (with same asset type) pk set that attached this gateway
         self.nids = set()
-        self._graph = nx.Graph()
+        self._graph = TopoGraph()
         self.spv_table = SPVHashTable()
         self.neighbors_hash = NetNeighborHash()
+        # increased by every mutation of the graph, the cached route is valid
+        # only if it was searched with the same version
+        self.version = 0
+        self.magic = None
+        self.network_trait = None
+        # the mutation log: (version, operation), the epoch identifies this log
+        # operation None means the mutation can't be replayed(whole graph compose)
+        self.epoch = uuid.uuid4().hex[:16]
+        self.mutation_log = deque(maxlen=cg_sync_log_size)
+        # {peer ip:port: (epoch, version)} the log position has sent to the peer
+        self.peer_sequences = {}
+        # {peer ip:port: (epoch, version)} the log position received from the peer
+        self.received_sequences = {}
+        # increased when the fee distances maybe shortened(edge added or fee changed)
+        self.metric_version = 0
+        self.landmarks = None
+        self._landmarks_scheduled = False
+
+    @property
+    def magic(self):
+        return self._graph.magic
+
+    @magic.setter
+    def magic(self, magic):
+        """
+        set before the nodes are added, the shared attributes are kept per magic
+        """
+        self._graph.magic = magic
 
     def __str__(self):
         return "Nettopo(nodes: {}, links: {})".format(
@@ -204,12 +316,17 @@ class Nettopo:
             pk = data.get("Publickey")
         if not pk:
             raise Exception("public_key must provide")
-        self._graph.add_node(pk, **data)
+        self._add_node(pk, data)
         self.nids.add(pk)
         # self.nid = pk
         # self.nid = data["Nid"]
         # self.node = self._graph.nodes[self.nid]
 
+    def _add_node(self, pk, data):
+        self._graph.add_node(pk, **data)
+        node_registry.attach(pk, self)
+        self.bump_version(["add_node", copy.deepcopy(data)])
+
     def add_edge(self, sid, tid):
         # first sid must in the graph
         # otherwise local node will not receive this sync type msg
@@ -218,12 +335,19 @@ class Nettopo:
             v_node = self._graph.nodes.get(tid)
             edge_data = utils.make_edge_data(u_node, v_node)
             self._graph.add_edge(sid, tid, **edge_data)
+            # the endpoints maybe added by the edge
+            node_registry.attach(sid, self)
+            node_registry.attach(tid, self)
+            self.metric_version += 1
+            self.bump_version(["add_edge", sid, tid])
+            return True
         else:
-            pass
+            return False
 
     def remove_edge(self, sid, tid):
         if self._graph.has_edge(sid, tid):
             self._graph.remove_edge(sid, tid)
+            self.bump_version(["remove_edge", sid, tid])
             return True
             # for nid in [sid, tid]:
             #     has_spv = True if len(self.spv_table.find(nid)) else False
@@ -241,12 +365,107 @@ class Nettopo:
         else: return
         for data in node_data:
             nid = data.get("Publickey")
-            if not self._graph.has_node(nid): return
+            if not self._graph.has_node(nid): continue
             node = self._graph.nodes[nid]
-            if data["Fee"] != node["Fee"]:
-                diff_fee = data["Fee"] - node["Fee"]
-                self._update_edge_data(nid, diff_fee)
+            if "Fee" in data and data["Fee"] != node.get("Fee"):
+                # the node added by the edge has no fee until its data arrived
+                if "Fee" in node:
+                    self._update_edge_data(nid, data["Fee"] - node["Fee"])
+                self.metric_version += 1
             self._update_node_data(node, data)
+            self.bump_version(["update_node", copy.deepcopy(data)])
+            # the shared attributes changed the node of other assets too
+            shared_data = {key: data[key] for key in data if key in SHARED_ATTRS}
+            if shared_data:
+                for topo in node_registry.get_topos(nid, self.magic):
+                    if topo is not self:
+                        topo._update_shared_data(nid, shared_data)
+
+    def _update_shared_data(self, pk, data):
+        """
+        the shared attributes of the node were updated by the topology of other asset
+        """
+        data = dict(data, Publickey=pk)
+        self.bump_version(["update_node", copy.deepcopy(data)])
+
+    def bump_version(self, operation=None):
+        """
+        :param operation: the replayable mutation, None if it can't be replayed
+        """
+        self.version += 1
+        self.mutation_log.append((self.version, operation))
+
+    def operations_since(self, epoch, version):
+        """
+        :param epoch: the epoch of the log that peer has seen\n
+        :param version: the version of the log that peer has seen\n
+        :return: list of the operations or None if the peer is too far behind
+        """
+        if epoch != self.epoch or version > self.version:
+            return None
+        operations = []
+        for log_version, operation in reversed(self.mutation_log):
+            if log_version <= version:
+                break
+            if operation is None:
+                return None
+            operations.append(operation)
+        else:
+            # the log has been truncated after the version
+            if operations and self.mutation_log[0][0] != version + 1:
+                return None
+        operations.reverse()
+        return operations
+
+    def apply_operations(self, operations):
+        """
+        replay the operations of the peer's mutation log\n
+        :return: number of the operations that changed the graph
+        """
+        changed = 0
+        for operation in operations:
+            op = operation[0]
+            if op in ["add_node", "update_node"]:
+                pk = operation[1].get("Publickey")
+                if not self._graph.has_node(pk):
+                    if op == "add_node":
+                        self._add_node(pk, operation[1])
+                        changed += 1
+                    continue
+                diff = self._diff_node_data(self.get_node_dict(pk), operation[1])
+                if diff:
+                    diff["Publickey"] = pk
+                    self.update_data(diff)
+                    changed += 1
+            elif op == "add_edge":
+                if self.add_edge(operation[1], operation[2]):
+                    changed += 1
+            elif op == "remove_edge":
+                if self.remove_edge(operation[1], operation[2]):
+                    changed += 1
+        return changed
+
+    def make_sync_body(self, peer):
+        """
+        make the graph sync body for the peer according to what it has seen\n
+        :param peer: ip:port of the peer gateway\n
+        :return: (sync_type, message_body)
+        """
+        sequence = self.peer_sequences.get(peer)
+        operations = self.operations_since(*sequence) if sequence else None
+        self.peer_sequences[peer] = (self.epoch, self.version)
+        # the full graph is cheaper when too many operations
+        if operations is None or len(operations) > len(self.get_nodes()) + self.get_number_of_edges():
+            return "add_whole_graph", self.to_json()
+        return "apply_delta", {"Operations": operations}
+
+    def forget_peer(self, ip):
+        """
+        the peer gateway disconnected, it maybe lost the graph
+        """
+        for peer in list(self.peer_sequences.keys()):
+            if peer.split(":")[0] == ip:
+                del self.peer_sequences[peer]
 
     def _isolated(self, nid):
         isolated = False
@@ -258,36 +477,283 @@ class Nettopo:
 
     def _update_node_data(self, node, data):
         print("update node attributes")
-        for key in node:
-            if key in data.keys():
-                if key == "Balance" and isinstance(data[key], dict):
-                    node[key].update(data[key])
-                else:
-                    node[key] = data[key]
+        for key in data:
+            if key == "Balance" and isinstance(data[key], dict) and isinstance(node.get(key), dict):
+                node[key].update(data[key])
+            else:
+                node[key] = data[key]
+
+    @staticmethod
+    def _diff_node_data(node, data):
+        """
+        :return: dict type, the attributes of data that differ from node
+        """
+        diff = {}
+        for key, value in data.items():
+            if key == "Balance" and isinstance(value, dict) and isinstance(node.get(key), dict):
+                balance = {name: v for name, v in value.items() if node[key].get(name) != v}
+                if balance:
+                    diff[key] = balance
+            elif node.get(key) != value:
+                diff[key] = value
+        return diff
 
     def _update_edge_data(self, nid, diff_fee):
         # update the edges's weight that include the nid
-        # self.edges[source, target]['weight'] = weight
+        # the adjacency of nid is the index of its edges, cost O(degree)
         print("update edge attribute")
-        for edge in self._graph.edges:
-            if nid in edge:
-                self._graph.edges[edge[0],edge[1]]["weight"] += diff_fee
+        for edge in self._graph.adj[nid].values():
+            if "weight" in edge:
+                edge["weight"] += diff_fee
+
+    def _edge_weight(self, u, v, edge):
+        """
+        :return: the fee of the edge, None if the fee of its node is not yet known
+        (the edge added before the node data arrived has no weight)
+        """
+        weight = edge.get("weight")
+        if weight is None:
+            nodes = self._graph.nodes
+            if nodes[u].get("Fee") is None or nodes[v].get("Fee") is None:
+                return None
+            weight = nodes[u]["Fee"] + nodes[v]["Fee"]
+        return weight
                 
+    def _make_weight(self, amount=None):
+        """
+        make the weight function for the route search\n
+        the edge is hidden(weight is None) when one of its nodes is off-line
+        or the payer's balance of the channel can not carry the amount\n
+        :param amount: the tx amount, None means don't check the balance
+        """
+        nodes = self._graph.nodes
+        def weight(u, v, edge):
+            # u is the payer of the hop u -> v
+            u_node = nodes[u]
+            if not u_node.get("Status") or not nodes[v].get("Status"):
+                return None
+            if amount:
+                balance = utils.parse_amount(u_node["Balance"].get(edge.get("name")))
+                if balance is not None and balance < amount:
+                    return None
+            return self._edge_weight(u, v, edge)
+        return weight
+
+    def _shortest_path(self, sid, tid, amount=None, ignore_nodes=None, ignore_edges=None):
+        """
+        :param ignore_nodes: the nodes should not be passed through\n
+        :param ignore_edges: the (u, v) edges should not be passed through\n
+        :return: type list, empty list if no path
+        """
+        weight = self._make_weight(amount)
+        if ignore_nodes or ignore_edges:
+            ignore_nodes = ignore_nodes or set()
+            ignore_edges = ignore_edges or set()
+            base_weight = weight
+            def weight(u, v, edge):
+                if u in ignore_nodes or v in ignore_nodes:
+                    return None
+                if (u, v) in ignore_edges or (v, u) in ignore_edges:
+                    return None
+                return base_weight(u, v, edge)
+        if cg_route_mode == "alt":
+            landmarks = self.get_landmarks()
+            if landmarks:
+                return landmarks.shortest_path(self._graph, sid, tid, weight)
+        try:
+            # the weight function is called by dijkstra_path since networkx 2.1,
+            # bidirectional_dijkstra of 2.1 only reads the weight attribute
+            path = nx.dijkstra_path(self._graph, sid, tid, weight=weight)
+        except (nx.exception.NetworkXNoPath, nx.exception.NodeNotFound):
+            path = []
+        return path
+
+    def get_landmarks(self):
+        """
+        :return: the LandmarkTable matches current metric, None if it is stale
+        and the refresh is scheduled(search with dijkstra meanwhile)
+        """
+        if self.landmarks and self.landmarks.metric_version == self.metric_version:
+            return self.landmarks
+        try:
+            loop = asyncio.get_event_loop()
+        except RuntimeError:
+            loop = None
+        # no loop to refresh in the background(tools and tests)
+        if not loop or not loop.is_running():
+            self.landmarks = LandmarkTable.build(self._graph, cg_landmark_count, self.metric_version)
+            return self.landmarks
+        if not self._landmarks_scheduled:
+            self._landmarks_scheduled = True
+            loop.call_later(cg_landmark_refresh_delay, self.refresh_landmarks)
+        return None
+
+    def refresh_landmarks(self):
+        """
+        build the landmark table in the executor over a copy of the weighted edges,
+        the table is swapped in when built, the stale one is rebuilt by the next get_landmarks
+        """
+        if self.landmarks and self.landmarks.metric_version == self.metric_version:
+            self._landmarks_scheduled = False
+            return
+        graph = nx.Graph()
+        graph.add_nodes_from(self._graph.nodes)
+        for u, v, edge in self._graph.edges(data=True):
+            weight = self._edge_weight(u, v, edge)
+            if weight is not None:
+                graph.add_edge(u, v, weight=weight)
+        future = asyncio.get_event_loop().run_in_executor(
+            None, LandmarkTable.build, graph, cg_landmark_count, self.metric_version)
+        future.add_done_callback(self._landmarks_built)
+
+    def _landmarks_built(self, future):
+        self._landmarks_scheduled = False
+        if future.cancelled():
+            return
+        if future.exception():
+            tcp_logger.error("build the landmarks of %s failed: %s", self.network_trait, future.exception())
+            return
+        table = future.result()
+        if not self.landmarks or table.metric_version > self.landmarks.metric_version:
+            self.landmarks = table
+
+    def _multi_source_shortest_path(self, sids, tids, amount=None):
+        """
+        one dijkstra from all the sources, stop at the first target reached\n
+        :return: type list, the cheapest path among all the source-target pairs,
+        empty list if no path
+        """
+        graph = self._graph
+        sids = [sid for sid in sids if graph.has_node(sid)]
+        tids = set(tid for tid in tids if graph.has_node(tid))
+        if not sids or not tids:
+            return []
+        weight = self._make_weight(amount)
+        dist = {}
+        prev = {}
+        visited = set()
+        heap = []
+        for sid in sids:
+            if sid not in dist:
+                dist[sid] = 0
+                heap.append((0, sid))
+        while heap:
+            d, u = heapq.heappop(heap)
+            if u in visited:
+                continue
+            if u in tids:
+                path = [u]
+                while path[-1] in prev:
+                    path.append(prev[path[-1]])
+                return list(reversed(path))
+            visited.add(u)
+            for v, edge in graph.adj[u].items():
+                if v in visited:
+                    continue
+                w = weight(u, v, edge)
+                if w is None:
+                    continue
+                nd = d + w
+                if nd < dist.get(v, float("inf")):
+                    dist[v] = nd
+                    prev[v] = u
+                    heapq.heappush(heap, (nd, v))
+        return []
+
+    def _path_weight(self, path):
+        weight = 0
+        for u, v in zip(path, path[1:]):
+            weight += self.get_node_dict(u)["Fee"] + self.get_node_dict(v)["Fee"]
+        return weight
+
     @timethis
-    def find_shortest_path_decide_by_fee(self, source, target):
+    def find_shortest_path_decide_by_fee(self, source, target, amount=None):
         """
         :param source: start uri\n
         :param target: end uri\n
+        :param amount: the tx amount, the channels can't carry it will be pruned\n
         :return type list ["A","B","C"]
         """
         sid = utils.get_public_key(source)
         tid = utils.get_public_key(target)
-        try:
-            path = nx.shortest_path(self._graph, sid, tid, weight='weight')
-        except nx.exception.NetworkXNoPath:
-            path = []
+        amount = utils.parse_amount(amount)
+        cache_key = (self.network_trait or id(self), sid, tid, amount)
+        path = route_cache.get(cache_key, self.version)
+        if path is not None:
+            return list(path)
+        path = self._shortest_path(sid, tid, amount)
+        route_cache.put(cache_key, self.version, tuple(path))
         return path
 
+    @timethis
+    def find_shortest_path_among(self, sources, targets, amount=None):
+        """
+        search the cheapest path from any of the sources to any of the targets
+        in one traversal\n
+        :param sources: list of start uri\n
+        :param targets: list of end uri\n
+        :param amount: the tx amount, the channels can't carry it will be pruned\n
+        :return type list ["A","B","C"]
+        """
+        sids = tuple(sorted(set(utils.get_public_key(source) for source in sources)))
+        tids = tuple(sorted(set(utils.get_public_key(target) for target in targets)))
+        amount = utils.parse_amount(amount)
+        cache_key = (self.network_trait or id(self), sids, tids, amount)
+        path = route_cache.get(cache_key, self.version)
+        if path is not None:
+            return list(path)
+        path = self._multi_source_shortest_path(sids, tids, amount)
+        route_cache.put(cache_key, self.version, tuple(path))
+        return path
+
+    @timethis
+    def find_k_shortest_paths_decide_by_fee(self, source, target, k, amount=None):
+        """
+        search the top k loop-free paths by Yen's algorithm\n
+        :param source: start uri\n
+        :param target: end uri\n
+        :param k: max number of the paths\n
+        :param amount: the tx amount, the channels can't carry it will be pruned\n
+        :return type list [["A","B","C"], ["A","D","C"]] ranked by fee
+        """
+        sid = utils.get_public_key(source)
+        tid = utils.get_public_key(target)
+        amount = utils.parse_amount(amount)
+        cache_key = (self.network_trait or id(self), sid, tid, amount, k)
+        paths = route_cache.get(cache_key, self.version)
+        if paths is not None:
+            return [list(path) for path in paths]
+        paths = []
+        path = self._shortest_path(sid, tid, amount)
+        if path:
+            paths.append(path)
+        # candidates heap: (weight, path)
+        candidates = []
+        seen = set([tuple(path)])
+        while paths and len(paths) < k:
+            last_path = paths[-1]
+            for i in range(len(last_path) - 1):
+                spur_node = last_path[i]
+                root_path = last_path[:i + 1]
+                ignore_edges = set()
+                for p in paths:
+                    if p[:i + 1] == root_path:
+                        ignore_edges.add((p[i], p[i + 1]))
+                ignore_nodes = set(root_path[:-1])
+                spur_path = self._shortest_path(spur_node, tid, amount, ignore_nodes, ignore_edges)
+                if not spur_path:
+                    continue
+                total_path = root_path[:-1] + spur_path
+                if tuple(total_path) in seen:
+                    continue
+                seen.add(tuple(total_path))
+                heapq.heappush(candidates, (self._path_weight(total_path), total_path))
+            if not candidates:
+                break
+            paths.append(heapq.heappop(candidates)[1])
+        route_cache.put(cache_key, self.version, tuple(tuple(path) for path in paths))
+        return paths
+
     def to_json(self, target=None):
         """
         :return type dict or json str
@@ -305,23 +771,53 @@ class Nettopo:
         graph = nx.readwrite.json_graph.node_link_graph(data)
         return graph
 
+    def merge_graph_data(self, data):
+        """
+        merge the node_link data in place, only the nodes, attributes and
+        edges that differ are applied(the received data take precedence)\n
+        :param data: type dict, the data of to_json\n
+        :return: number of the changed nodes and edges
+        """
+        changed = 0
+        for node in data.get("nodes", []):
+            node_data = dict(node)
+            pk = node_data.pop("id")
+            if not self._graph.has_node(pk):
+                self._add_node(pk, node_data)
+                changed += 1
+                continue
+            diff = self._diff_node_data(self.get_node_dict(pk), node_data)
+            if diff:
+                diff["Publickey"] = pk
+                self.update_data(diff)
+                changed += 1
+        for link in data.get("links", data.get("edges", [])):
+            if self.add_edge(link["source"], link["target"]):
+                changed += 1
+        return changed
+
     def sync_channel_graph_from_graph(self, data):
         """
-        :param data: type dict
+        :param data: type dict\n
+        :return: number of the changed nodes and edges
         """
         # sender_nid = utils.get_public_key(data["Sender"])
         # receiver_nid = utils.get_public_key(data["Receiver"])
         sender_nid = utils.get_public_key(data["Source"])
         receiver_nid = utils.get_public_key(data["Target"])
-        sync_graph = self.to_graph(data["MessageBody"])
-        self._graph = nx.algorithms.operators.binary.compose(self._graph, sync_graph)
-        self.add_edge(sender_nid, receiver_nid)
+        changed = self.merge_graph_data(data["MessageBody"])
+        if self.add_edge(sender_nid, receiver_nid):
+            changed += 1
+        return changed
 
     def sync_channel_graph(self, data):
         """
-        :param data: type dict
+        :param data: type dict\n
+        :return: number of the changed nodes and edges for the graph sync types,
+        True for the others
         """
         sync_type = data.get("SyncType")
+        changed = True
         # when sync to peers
         if sync_type == "add_single_edge":
             sid = utils.get_public_key(data["Source"])
@@ -333,16 +829,29 @@ class Nettopo:
             tid = utils.get_public_key(data["Target"])
             self.remove_edge(sid, tid)
         elif sync_type == "update_node_data":
-            data = data["MessageBody"]
-            self.update_data(data)
+            self.update_data(data["MessageBody"])
         elif sync_type == "add_whole_graph":
-            self.sync_channel_graph_from_graph(data)
+            changed = self.sync_channel_graph_from_graph(data)
+        elif sync_type == "apply_delta":
+            changed = self.apply_operations(data["MessageBody"]["Operations"])
+            if self.add_edge(utils.get_public_key(data["Source"]), utils.get_public_key(data["Target"])):
+                changed += 1
+        if data.get("Epoch"):
+            peer = utils.get_ip_port(data["Sender"] if isinstance(data["Sender"], str) else data["Sender"][0])
+            self.received_sequences[peer] = (data["Epoch"], data["Sequence"])
+        return changed
+
+    def _networkx_graph(self):
+        """
+        :return: the networkx graph to draw
+        """
+        return self._graph
 
     def draw_graph(self):
         import matplotlib.pyplot as plt
         plt.subplot()
-        nx.draw(self._graph, with_labels=True, font_size=3)
-        plt.savefig("test/{}.png".format(self.nid))
+        nx.draw(self._networkx_graph(), with_labels=True, font_size=3)
+        plt.savefig("test/{}.png".format(self.network_trait))
 
     def show_edgelist(self):
         return nx.convert.to_edgelist(self._graph)
@@ -379,6 +888,16 @@ class Nettopo:
     def get_neighbors(self, net_id):
         self.neighbors_hash.get_ext_neighbor(net_id)
 
+    @classmethod
+    def create(cls):
+        """
+        create the topo with the graph backend selected by cg_topo_backend
+        """
+        if cls is Nettopo and cg_topo_backend == "compact":
+            from compacttopo import CompactNettopo
+            return CompactNettopo()
+        return cls()
+
     @classmethod
     def add_or_update(cls, topos, asset_type, magic, wallet, neighbor=None):
         """
@@ -391,12 +910,15 @@ class Nettopo:
             topo = topos[utils.asset_type_magic_patch(asset_type, magic)]
             if topo.has_node(pk):
                 topo.update_data(data)
-                # pass
+                # the node loaded from the snapshot or synced by the peers
+                # is attached this gateway again
+                topo.nids.add(pk)
             else:
                 topo.add_node(data, pk=pk)
                 topo.add_neighbor(network_trait, neighbor)
         else:
-            topo = cls()
+            topo = cls.create()
             topo.magic = magic
+            topo.network_trait = network_trait
             topo.add_node(data, pk=pk)
             topos[utils.asset_type_magic_patch(asset_type, magic)] = topo
\ No newline at end of file
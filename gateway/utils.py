@@ -4,15 +4,19 @@ gateway utils
 """
 import json
 import re
+import time
+import asyncio
 from config import cg_end_mark, cg_bytes_encoding, cg_wsocket_addr,\
- cg_tcp_addr, cg_public_ip_port, cg_remote_jsonrpc_addr, cg_local_jsonrpc_addr
+ cg_tcp_addr, cg_public_ip_port, cg_remote_jsonrpc_addr, cg_local_jsonrpc_addr,\
+ cg_max_router_count, cg_search_wallet_ttl, cg_search_wallet_timeout, cg_wire_codecs,\
+ cg_codec_compress_threshold
 import os
 import sys
 path = os.getcwd().replace("/gateway", "")
 sys.path.append(path)
 # from model.channel_model import APIChannel
 # from model.node_model import APINode
-import struct
+import codec
 
 request_handle_result = {
     "invalid": 0,
@@ -29,33 +33,40 @@ def _add_end_mark(text):
     return text
 
 
-def decode_bytes(bdata, target="dict"):
+def decode_bytes(bdata, target="dict", version=codec.JSON_VERSION):
     """
     :param bdata: bytes type\n
     :param target: "dict" or "str"\n
+    :param version: the version field of the frame header\n
     :return: python obj or str
     """
+    if version != codec.JSON_VERSION:
+        return codec.decode_body(version, bdata, cg_bytes_encoding)
     data = bdata.decode(cg_bytes_encoding)
     if target == "dict":
         # data = _remove_end_mark(data)
-        data = json.loads(data)
+        data = codec.loads(data)
     return data
 
-def encode_bytes(data):
+def encode_bytes(data, wire_codec=(codec.CODEC_JSON, codec.COMPRESS_NONE), envelope=False):
     """
     encode python obj to bytes data\n
+    :param wire_codec: (codec, compression) negotiated with the peer\n
+    :param envelope: add the routing envelope for the relay gateways\n
     :return: bytes type
     """
-    if type(data) != str:
-        data = json.dumps(data)
-    # data = _add_end_mark(data)
-    version = 0x000001
-    cmd = 0x000065
-    bdata = data.encode(cg_bytes_encoding)
-    header = [version, len(bdata), cmd]
-    header_pack = struct.pack("!3I", *header)
-    return header_pack + bdata
-    # return data.encode(cg_bytes_encoding)
+    return codec.encode_frame(
+        data, wire_codec[0], wire_codec[1],
+        compress_threshold=cg_codec_compress_threshold,
+        encoding=cg_bytes_encoding,
+        envelope=envelope
+    )
+
+def get_wire_codecs():
+    """
+    :return: list of the codec names advertised to the peers
+    """
+    return [name for name in codec.available_codecs() if name in cg_wire_codecs]
 
 def save_wallet_cli(clients):
     with open("wcli.json", "w") as fs:
@@ -170,6 +181,29 @@ def get_addr(url):
 def parse_url(url):
     return url.split("@")
 
+def parse_amount(value):
+    """
+    :param value: the amount of tx or balance, maybe str or number\n
+    :return: float or None when the value is invalid
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def parse_router_count(value):
+    """
+    :param value: the RouterCount of GetRouterInfo message\n
+    :return: int between 1 and cg_max_router_count or None
+    """
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        return None
+    if count < 1:
+        return None
+    return min(count, cg_max_router_count)
+
 def del_dict_item_by_value(dic, value):
     values = list(dic.values())
     if value in values:
@@ -270,19 +304,93 @@ def _make_router(path, full_path, net_topo):
         }
     return router
 
-def _search_target_wallets(receiver, asset_type, magic):
+def _make_routers(paths, net_topo, count=None):
+    """
+    :param count: None means only the best router is needed\n
+    :return: router or list of routers ranked by fee when count provided
+    """
+    if count:
+        return [_make_router(path, [], net_topo) for path in paths]
+    return _make_router(paths[0] if paths else [], [], net_topo)
+
+def _find_paths(net_topo, source, target, amount=None, count=None):
+    """
+    :param count: max number of the paths, None means only the shortest one\n
+    :return: list of path
+    """
+    if count:
+        return net_topo.find_k_shortest_paths_decide_by_fee(source, target, count, amount)
+    path = net_topo.find_shortest_path_decide_by_fee(source, target, amount)
+    return [path] if path else []
+
+def _find_paths_among(net_topo, sources, targets, amount=None, count=None):
+    """
+    search the cheapest path among all the source-target pairs in one traversal\n
+    :param count: max number of the paths, the alternatives are searched
+    between the endpoints of the cheapest path\n
+    :return: list of path
+    """
+    if not sources or not targets:
+        return []
+    path = net_topo.find_shortest_path_among(sources, targets, amount)
+    if not path:
+        return []
+    if count:
+        return _find_paths(net_topo, path[0], path[-1], amount, count)
+    return [path]
+
+# {(receiver, asset_type, magic): (timestamp, wallets)}
+_target_wallets_cache = {}
+# {(receiver, asset_type, magic): future} the in-flight searches
+_target_wallets_futures = {}
+
+async def _request_target_wallets(receiver, asset_type, magic):
+    """
+    :return: list of wallet public keys, None if the remote gateway failed
+    """
     from network import Network
     from message import MessageMake
     addr = (get_addr(receiver)[0], cg_local_jsonrpc_addr[1])
     message = MessageMake.make_search_target_wallet(get_public_key(receiver), asset_type, magic)
-    response = Network.send_msg_with_jsonrpc_sync("Search", addr, message)
-    if response:
-        target = response.get("Wallets")
-    else:
-        target = []
+    try:
+        response = await asyncio.wait_for(
+            Network.send_msg_with_jsonrpc_coro("Search", addr, message),
+            cg_search_wallet_timeout
+        )
+    except Exception:
+        response = None
+    if isinstance(response, str):
+        response = json.loads(response)
+    if not response:
+        return None
+    return response.get("Wallets") or []
+
+async def _search_target_wallets(receiver, asset_type, magic):
+    """
+    search the wallets attached the receiver spv from the remote gateway\n
+    the result is cached for cg_search_wallet_ttl seconds and the concurrent
+    same searches share one request
+    """
+    key = (receiver, asset_type, magic)
+    cached = _target_wallets_cache.get(key)
+    if cached and time.time() - cached[0] < cg_search_wallet_ttl:
+        return cached[1]
+    future = _target_wallets_futures.get(key)
+    if not future:
+        future = asyncio.ensure_future(_request_target_wallets(receiver, asset_type, magic))
+        _target_wallets_futures[key] = future
+        future.add_done_callback(lambda f: _target_wallets_futures.pop(key, None))
+    target = await asyncio.shield(future)
+    if target is None:
+        return []
+    now = time.time()
+    if key not in _target_wallets_cache:
+        for k in [k for k, v in _target_wallets_cache.items() if now - v[0] >= cg_search_wallet_ttl]:
+            del _target_wallets_cache[k]
+    _target_wallets_cache[key] = (now, target)
     return target
 
-def search_route_for_spv(sender, source_list, receiver, net_topo, asset_type, magic):
+async def search_route_for_spv(sender, source_list, receiver, net_topo, asset_type, magic, amount=None, count=None):
 
     """
     :param sender: spv self url
@@ -290,13 +398,14 @@ def search_route_for_spv(sender, source_list, receiver, net_topo, asset_type, ma
     :param receiver: tx target url
     :param net_topo:
     :param asset_type: 
+    :param amount: tx amount
+    :param count: max number of routers, return a list of routers if provided
     """
     receiver_pk, rev_ip = parse_url(receiver)
     spv_pk, sed_ip = parse_url(sender)
     source_wallet_pks = []
     target_wallet_pks = []
-    path = []
-    full_path = []
+    paths = []
     for source in source_list:
         source_pk = get_public_key(source)
         if net_topo.get_node_dict(source_pk)["Status"]:
@@ -310,56 +419,47 @@ def search_route_for_spv(sender, source_list, receiver, net_topo, asset_type, ma
         common_wallet_set = set(source_wallet_pks).intersection(set(target_wallet_pks))
         # spv-wallet-spv
         if len(common_wallet_set):
-            wallet_pk = list(common_wallet_set)[0]
-            path = [wallet_pk]
+            paths = [[wallet_pk] for wallet_pk in common_wallet_set]
         # spv-wallet-..-wallet-spv not attached in same gateway
         # search target wallet from remote gateway
-        if not len(path) and sed_ip != rev_ip:
-            target_wallet_pks = _search_target_wallets(receiver, asset_type, magic)
-            if len(target_wallet_pks):
-                for s_pk in source_wallet_pks:
-                    if len(path): break
-                    for t_pk in target_wallet_pks:
-                        path = net_topo.find_shortest_path_decide_by_fee(s_pk, t_pk)
-                        if len(path): break
+        if not len(paths) and sed_ip != rev_ip:
+            target_wallet_pks = await _search_target_wallets(receiver, asset_type, magic)
+            paths = _find_paths_among(net_topo, source_wallet_pks, target_wallet_pks, amount, count)
     # spv-wallet-..-wallet tx
     else:
-        for s_pk in source_wallet_pks:
-            path = net_topo.find_shortest_path_decide_by_fee(s_pk, receiver_pk)
-            if len(path): break
-    return _make_router(path, full_path, net_topo)
+        paths = _find_paths_among(net_topo, source_wallet_pks, [receiver_pk], amount, count)
+    return _make_routers(paths[:count] if count else paths, net_topo, count)
 
-def search_route_for_wallet(sender, receiver, net_topo, asset_type, magic):
+async def search_route_for_wallet(sender, receiver, net_topo, asset_type, magic, amount=None, count=None):
     
     """
     :param sender: spv self url
     :param receiver: tx target url
     :param net_topo:
+    :param amount: tx amount
+    :param count: max number of routers, return a list of routers if provided
     """
     rev_pk = get_public_key(receiver)
     sed_pk = get_public_key(sender)
-    path = []
-    full_path = []
+    paths = []
     # wallet-wallet-..-spv
     if check_is_spv(receiver):
         target_wallet_pks = []
         # sender and receiver is attached same gateway(same ip)
         # search target wallet from local spv table
         if get_addr(sender)[0] == get_addr(receiver)[0]:
-            for key in net_topo.spv_table.find_keys(receiver_pk):
+            for key in net_topo.spv_table.find_keys(rev_pk):
                 # check wallet is on-line
                 if net_topo.get_node_dict(key)["Status"]:
                     target_wallet_pks.append(key)
         # search target wallet from remote spv table
         else:
-            target_wallet_pks = _search_target_wallets(receiver, asset_type, magic)
-        for t_pk in target_wallet_pks:
-            path = net_topo.find_shortest_path_decide_by_fee(sed_pk, t_pk)
-            if len(path): break
+            target_wallet_pks = await _search_target_wallets(receiver, asset_type, magic)
+        paths = _find_paths_among(net_topo, [sed_pk], target_wallet_pks, amount, count)
     # wallet-wallet-..-wallet
     else:
-        path = net_topo.find_shortest_path_decide_by_fee(sed_pk, rev_pk)
-    return _make_router(path, full_path, net_topo)
+        paths = _find_paths(net_topo, sed_pk, rev_pk, amount, count)
+    return _make_routers(paths, net_topo, count)
 
 def make_edge_data(u_node, v_node):
     if not u_node or not v_node: return {}
@@ -25,7 +25,7 @@ SOFTWARE."""
 import requests
 from wallet.configure import Configure
 from log import LOG
-import json
+from gateway import codec
 from wallet.utils import get_wallet_info, get_magic
 
 class GatewayInfo(object):
@@ -59,7 +59,8 @@ def sync_channel(message_type, channel_name,founder, receiver, balance, magic):
         "params": [message],
         "id": 1
     }
-    result = requests.post(Configure["GatewayURL"], json=request)
+    result = requests.post(Configure["GatewayURL"], data=codec.dumps(request),
+                           headers={"Content-Type": "application/json"})
     return result.json()
 
 
@@ -75,7 +76,8 @@ def sync_channel_list(channel_list):
         "params": [message],
         "id": 1
     }
-    result = requests.post(Configure["GatewayURL"], json=request)
+    result = requests.post(Configure["GatewayURL"], data=codec.dumps(request),
+                           headers={"Content-Type": "application/json"})
     return result.json()
 
 
@@ -91,7 +93,8 @@ def join_gateway(publickey):
         "params": [message],
         "id": 1
     }
-    result = requests.post(Configure["GatewayURL"], json=request)
+    result = requests.post(Configure["GatewayURL"], data=codec.dumps(request),
+                           headers={"Content-Type": "application/json"})
     if result.ok:
         return result.json()
     else:
@@ -106,19 +109,21 @@ def get_router_info(message):
         "params": [message],
         "id": 1
     }
-    result = requests.post(Configure["GatewayURL"], json=request)
+    result = requests.post(Configure["GatewayURL"], data=codec.dumps(request),
+                           headers={"Content-Type": "application/json"})
     return result.json()
 
 
 def send_message(message, method="TransactionMessage" ):
-    LOG.info("GateWay Send Message: {}".format(json.dumps(message)))
+    LOG.info("GateWay Send Message: %s", codec.JsonText(message))
     request= {
             "jsonrpc": "2.0",
             "method": method,
             "params": [message],
             "id": 1
     }
-    result = requests.post(Configure["GatewayURL"], json=request)
+    result = requests.post(Configure["GatewayURL"], data=codec.dumps(request),
+                           headers={"Content-Type": "application/json"})
     return result.json()
 
 def close_wallet():
@@ -133,7 +138,8 @@ def close_wallet():
             "params": [message],
             "id": 1
     }
-    result = requests.post(Configure["GatewayURL"], json=request)
+    result = requests.post(Configure["GatewayURL"], data=codec.dumps(request),
+                           headers={"Content-Type": "application/json"})
     return result.json()
 
 
@@ -30,6 +30,7 @@ from wallet.configure import Configure
 from wallet.Interface.gate_way import join_gateway
 from wallet.Interface.rpc_interface import CurrentLiveWallet
 from log import LOG
+from gateway import codec
 
 
 class GatwayClientProtocol(protocol.Protocol):
@@ -37,11 +38,16 @@ class GatwayClientProtocol(protocol.Protocol):
     printlog = True
 
     def connectionMade(self):
+        from gateway.config import cg_max_frame_size
         self.transport.setTcpNoDelay(True)
+        # json until the gateway acks the codecs it can read
+        self.codec = (codec.CODEC_JSON, codec.COMPRESS_NONE)
+        self.decoder = codec.FrameDecoder(cg_max_frame_size)
         message = {
                    "MessageType": "RegisterKeepAlive",
                    "Ip":          "{}:{}".format(Configure.get("NetAddress"),Configure.get("NetPort")),
                    "Protocol":"TCP",
+                   "Codecs": codec.available_codecs()
                   }
         self.transport.write(encode_bytes(message))
         Message.Connection = True
@@ -53,9 +59,20 @@ class GatwayClientProtocol(protocol.Protocol):
         print("Connect the Gateway")
         GatwayClientProtocol.printlog = True
 
+    def dataReceived(self, data):
+        self.decoder.feed(data)
+        try:
+            for version, body in self.decoder.frames():
+                message = codec.decode_body(version, body)
+                if message.get("MessageType") == "AckRegisterKeepAlive":
+                    self.codec = codec.negotiate(message.get("Codecs"))
+        except (codec.FrameError, codec.CodecError) as e:
+            LOG.error(e)
+            self.transport.loseConnection()
+
     def senddata(self, message):
         print("send", message)
-        self.transport.write(encode_bytes(message))
+        self.transport.write(encode_bytes(message, self.codec))
 
 
 
@@ -90,23 +107,16 @@ class GatwayClientFactory(protocol.ClientFactory):
         return self.protocol
 
 
-def encode_bytes(data):
+def encode_bytes(data, wire_codec=(codec.CODEC_JSON, codec.COMPRESS_NONE)):
     """
     encode python obj to bytes data\n
+    :param wire_codec: (codec, compression) negotiated with the gateway\n
     :return: bytes type
     """
-    import json
-    import struct
-    from gateway.config import cg_bytes_encoding
-    if type(data) != str:
-        data = json.dumps(data)
-    # data = _add_end_mark(data)
-    version = 0x000001
-    cmd = 0x000065
-    bdata = data.encode(cg_bytes_encoding)
-    header = [version, len(bdata), cmd]
-    header_pack = struct.pack("!3I", *header)
-    return header_pack + bdata
+    from gateway.config import cg_bytes_encoding, cg_codec_compress_threshold
+    return codec.encode_frame(data, wire_codec[0], wire_codec[1],
+                              compress_threshold=cg_codec_compress_threshold,
+                              encoding=cg_bytes_encoding)
 
 
 
@@ -44,6 +44,7 @@ from wallet.BlockChain.monior import register_block, \
 from wallet.BlockChain.interface import check_vmstate
 from model import APIChannel
 from log import LOG
+from gateway.codec import JsonText
 import json
 from wallet.TransactionManagement.payment import Payment
 
@@ -136,7 +137,7 @@ class RegisterMessage(Message):
         self.wallet = wallet
 
     def handle_message(self):
-        LOG.info("Handle RegisterMessage: {}".format(json.dumps(self.message)))
+        LOG.info("Handle RegisterMessage: %s", JsonText(self.message))
         verify, error = self.verify()
         if not verify:
             message = {
@@ -537,7 +538,7 @@ class FounderMessage(TransactionMessage):
                                  "Comments": self.comments
                                 }
         Message.send(message_response)
-        LOG.info("Send FounderMessage Response:  {}".format(json.dumps(message_response )))
+        LOG.info("Send FounderMessage Response:  %s", JsonText(message_response))
         return None
 
 
@@ -770,7 +771,7 @@ class RsmcMessage(TransactionMessage):
 
         transaction = TrinityTransaction(channel_name, wallet)
         founder = transaction.get_founder()
-        LOG.debug("Rsmc Create  founder {}".format(json.dumps(founder)))
+        LOG.debug("Rsmc Create  founder %s", JsonText(founder))
         tx_state = transaction.get_transaction_state()
         channel = ch.Channel.channel(channel_name)
         balance = channel.get_balance()
@@ -940,7 +941,7 @@ class RsmcMessage(TransactionMessage):
         self.transaction.update_transaction(str(self.tx_nonce), MonitorTxId=ctxid)
 
     def _handle_0_message(self):
-        LOG.info("RSMC handle 0 message {}".format(json.dumps(self.message)))
+        LOG.info("RSMC handle 0 message %s", JsonText(self.message))
         # recorc monitor commitment txid
         self.store_monitor_commitement()
         self.send_responses()
@@ -962,7 +963,7 @@ class RsmcMessage(TransactionMessage):
 
     def _handle_1_message(self):
 
-        LOG.info("RSMC handle 1 message  {}".format(json.dumps(self.message)))
+        LOG.info("RSMC handle 1 message  %s", JsonText(self.message))
         if not self.check_role_index(0):
             return None
         self.store_monitor_commitement()
@@ -976,7 +977,7 @@ class RsmcMessage(TransactionMessage):
 
     def _handle_2_message(self):
         # send 3 message
-        LOG.info("RSMC handle 2 message  {}".format(json.dumps(self.message)))
+        LOG.info("RSMC handle 2 message  %s", JsonText(self.message))
         if not self.check_role_index(1):
             return None
         self.transaction.update_transaction(str(self.tx_nonce), BR=self.breach_remedy)
@@ -988,7 +989,7 @@ class RsmcMessage(TransactionMessage):
         print("receive %s %s success" % (str(self.value), str(self.asset_type)))
 
     def _handle_3_message(self):
-        LOG.info("RSMC handle 3 message  {}".format(json.dumps(self.message)))
+        LOG.info("RSMC handle 3 message  %s", JsonText(self.message))
         if not self.check_role_index(1):
             return None
         self.transaction.update_transaction(str(self.tx_nonce), BR=self.breach_remedy)
@@ -1070,7 +1071,7 @@ class RsmcMessage(TransactionMessage):
                                 "Error": error
                                 }
             self.send(message_response)
-            LOG.info("Send RsmcMessage Response {}".format(json.dumps(message_response)))
+            LOG.info("Send RsmcMessage Response %s", JsonText(message_response))
 
 
 class RsmcResponsesMessage(TransactionMessage):
@@ -1096,7 +1097,7 @@ class RsmcResponsesMessage(TransactionMessage):
         self.transaction = TrinityTransaction(self.channel_name, self.wallet)
 
     def handle_message(self):
-        LOG.info("Handle RsmcResponsesMessage: {}".format(json.dumps(self.message)))
+        LOG.info("Handle RsmcResponsesMessage: %s", JsonText(self.message))
         if self.error:
             print("RsmcResponsesMessage error %s" %self.error)
         verify, error = self.verify()
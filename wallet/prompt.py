@@ -13,6 +13,7 @@ from prompt_toolkit.shortcuts import print_tokens
 from prompt_toolkit.token import Token
 from twisted.internet import reactor, endpoints, protocol
 from log import LOG
+from gateway.codec import JsonText
 from lightwallet.Settings import settings
 from wallet.utils import get_arg, \
     get_asset_type_name,\
@@ -518,7 +519,7 @@ class UserPromptInterface(PromptInterface):
             time.sleep(0.1)
 
     def _handlemessage(self,message):
-        LOG.info("Handle Message: <---- {}".format(json.dumps(message)))
+        LOG.info("Handle Message: <---- %s", JsonText(message))
         if isinstance(message,str):
             message = json.loads(message)
         try: